@@ -38,6 +38,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'user.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -58,6 +59,15 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'user.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'user.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
 
@@ -144,3 +154,20 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 AUTH_USER_MODEL = 'user.User'
+
+# Bulk import
+BULK_IMPORT_BATCH_SIZE = 1000
+BULK_IMPORT_MAX_REPORTED_ERRORS = 1000
+
+# Streaming export
+EXPORT_BATCH_SIZE = 2000
+
+# Reservation archive
+RESERVATION_ARCHIVE_AFTER_DAYS = 365
+RESERVATION_ARCHIVE_BATCH_SIZE = 1000
+
+# Bulk reservation/queue operations
+BULK_OPERATIONS_MAX_ITEMS = 1000
+
+# Response compression (user.middleware.CompressionMiddleware)
+COMPRESSION_MIN_SIZE = 1024
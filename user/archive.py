@@ -0,0 +1,73 @@
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Value
+
+from .models import ArchivedReservation, Queue, QueueHistory, Reservation
+
+HISTORY_FIELDS = ('id', 'date', 'time', 'reservation_time', 'doctor_id', 'patient_id', 'archived')
+
+
+def get_archive_horizon():
+    return datetime.timedelta(days=getattr(settings, 'RESERVATION_ARCHIVE_AFTER_DAYS', 365))
+
+
+def get_batch_size():
+    return getattr(settings, 'RESERVATION_ARCHIVE_BATCH_SIZE', 1000)
+
+
+def archive_reservations(before=None, batch_size=None):
+    """Move reservations dated before `before` into ArchivedReservation, one transaction per batch."""
+    before = before or datetime.date.today() - get_archive_horizon()
+    batch_size = batch_size or get_batch_size()
+    moved = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                Reservation.objects.filter(date__lt=before).order_by('date', 'time')
+                .values('id', 'doctor_id', 'date', 'time', 'patient_id', 'reservation_time')[:batch_size]
+            )
+            if not rows:
+                return moved
+            ArchivedReservation.objects.bulk_create(
+                [ArchivedReservation(**row) for row in rows], ignore_conflicts=True,
+            )
+            Reservation.objects.filter(id__in=[row['id'] for row in rows]).delete()
+        moved += len(rows)
+
+
+def filter_history(queryset, date_from=None, date_to=None, doctor=None, patient=None):
+    if date_from:
+        queryset = queryset.filter(date__gte=date_from)
+    if date_to:
+        queryset = queryset.filter(date__lte=date_to)
+    if doctor:
+        queryset = queryset.filter(doctor_id=doctor)
+    if patient:
+        queryset = queryset.filter(patient_id=patient)
+    return queryset
+
+
+def history_querysets(**filters):
+    # Live rows first, then archived ones; both carry an `archived` flag so callers can tell them apart
+    return [
+        filter_history(Reservation.objects.all(), **filters).annotate(archived=Value(False)),
+        filter_history(ArchivedReservation.objects.all(), **filters).annotate(archived=Value(True)),
+    ]
+
+
+def reservation_history(**filters):
+    live, archived = (queryset.values(*HISTORY_FIELDS) for queryset in history_querysets(**filters))
+    return live.union(archived, all=True)
+
+
+def remove_queue_entries(entries, outcome):
+    """Delete queue entries, keeping a QueueHistory row for each so the queue export still sees them."""
+    with transaction.atomic():
+        QueueHistory.objects.bulk_create([
+            QueueHistory(id=entry.id, patient_id=entry.patient_id, doctor_id=entry.doctor_id,
+                         position=entry.position, timestamp=entry.timestamp, outcome=outcome)
+            for entry in entries
+        ], ignore_conflicts=True)
+        Queue.objects.filter(id__in=[entry.id for entry in entries]).delete()
@@ -0,0 +1,282 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import Max
+from rest_framework import serializers
+
+from .archive import remove_queue_entries
+from .models import Doctor, Patient, Queue, QueueHistory, Reservation
+from .serializers import (
+    ReservationBulkCreateSerializer, ReservationBulkMoveSerializer,
+    QueueBulkCreateSerializer, QueueBulkMoveSerializer,
+)
+
+User = get_user_model()
+
+OPERATIONS = ('create', 'move', 'cancel')
+
+# How often a reservation batch is re-checked after losing a slot to a concurrent booking
+SLOT_ATTEMPTS = 3
+
+
+def get_max_items():
+    return getattr(settings, 'BULK_OPERATIONS_MAX_ITEMS', 1000)
+
+
+class BatchError(Exception):
+    pass
+
+
+def read_operations(data):
+    if not isinstance(data, dict):
+        raise BatchError('Expected an object with create, move and/or cancel lists.')
+    operations = {}
+    for operation in OPERATIONS:
+        items = data.get(operation, [])
+        if not isinstance(items, list):
+            raise BatchError(f"'{operation}' must be a list.")
+        operations[operation] = items
+    if sum(len(items) for items in operations.values()) > get_max_items():
+        raise BatchError(f'At most {get_max_items()} items per request.')
+    return operations
+
+
+class Batch:
+    """Validates every item up front, then applies the survivors in one transaction.
+
+    Results are reported per item, in request order, under the operation they were sent with.
+    """
+    create_serializer_class = None
+    move_serializer_class = None
+    cancel_field = None
+
+    def __init__(self, data, doctor=None):
+        self.operations = read_operations(data)
+        # When set, only rows under this doctor may be created, moved or cancelled
+        self.doctor = doctor
+        self.results = {operation: [None] * len(items) for operation, items in self.operations.items()}
+
+    def fail(self, operation, index, errors):
+        self.results[operation][index] = {'index': index, 'status': 'error', 'errors': errors}
+
+    def succeed(self, operation, index, status, pk):
+        self.results[operation][index] = {'index': index, 'status': status, 'id': pk}
+
+    def validate(self, operation, serializer_class):
+        valid = []
+        for index, item in enumerate(self.operations[operation]):
+            serializer = serializer_class(data=item)
+            if serializer.is_valid():
+                valid.append((index, serializer.validated_data))
+            else:
+                self.fail(operation, index, serializer.errors)
+        return valid
+
+    def validate_cancels(self):
+        valid = []
+        for index, item in enumerate(self.operations['cancel']):
+            try:
+                valid.append((index, {'id': self.cancel_field.run_validation(item)}))
+            except serializers.ValidationError as e:
+                self.fail('cancel', index, {'id': e.detail})
+        return valid
+
+    def check_touched_once(self, items):
+        ids = [data['id'] for _, data in items]
+        if len(set(ids)) < len(ids):
+            raise BatchError('Each row may be moved or cancelled at most once per request.')
+
+    def drop_missing(self, operation, items, field, existing, message):
+        remaining = []
+        for index, data in items:
+            if data[field] in existing:
+                remaining.append((index, data))
+            else:
+                self.fail(operation, index, {field: [message]})
+        return remaining
+
+    def scope(self, queryset):
+        # Other doctors' rows are reported as not found rather than revealed
+        return queryset.filter(doctor=self.doctor) if self.doctor else queryset
+
+    def drop_other_doctors(self, creates):
+        if not self.doctor:
+            return creates
+        return self.drop_missing('create', creates, 'doctor', {self.doctor.pk}, 'You can only manage your own schedule.')
+
+    def load(self, queryset, operation_items):
+        # One query for every row touched by move/cancel
+        return self.scope(queryset).in_bulk({data['id'] for items in operation_items for _, data in items})
+
+    def run(self):
+        raise NotImplementedError
+
+
+class ReservationBatch(Batch):
+    create_serializer_class = ReservationBulkCreateSerializer
+    move_serializer_class = ReservationBulkMoveSerializer
+    cancel_field = serializers.UUIDField()
+
+    def run(self):
+        creates = self.validate('create', self.create_serializer_class)
+        moves = self.validate('move', self.move_serializer_class)
+        cancels = self.validate_cancels()
+
+        creates = self.drop_other_doctors(creates)
+        doctors = set(Doctor.objects.filter(pk__in={data['doctor'] for _, data in creates}).values_list('pk', flat=True))
+        patients = set(User.objects.filter(pk__in={data['patient'] for _, data in creates}).values_list('pk', flat=True))
+        creates = self.drop_missing('create', creates, 'doctor', doctors, 'Doctor not found.')
+        creates = self.drop_missing('create', creates, 'patient', patients, 'Patient not found.')
+
+        for _ in range(SLOT_ATTEMPTS):
+            try:
+                with transaction.atomic():
+                    return self.apply(creates, moves, cancels)
+            except IntegrityError:
+                # A reservation booked outside this batch took one of our slots between the check
+                # and the insert; everything was rolled back and the next attempt will see it
+                continue
+        for operation, items in (('create', creates), ('move', moves), ('cancel', cancels)):
+            for index, _ in items:
+                self.fail(operation, index, {'non_field_errors': ['Slots kept changing during the request; try again.']})
+        return self.results
+
+    def apply(self, creates, moves, cancels):
+        reservations = self.load(Reservation.objects.select_for_update(), [moves, cancels])
+        moves = self.drop_missing('move', moves, 'id', reservations, 'Reservation not found.')
+        cancels = self.drop_missing('cancel', cancels, 'id', reservations, 'Reservation not found.')
+        self.check_touched_once(moves + cancels)
+
+        targets = [('create', index, (data['doctor'], data['date'], data['time'])) for index, data in creates]
+        targets += [('move', index, (reservations[data['id']].doctor_id, data['date'], data['time']))
+                    for index, data in moves]
+        # Lock the doctors whose days are being rearranged so two batches cannot both see a slot free
+        affected = {slot[0] for _, _, slot in targets}
+        list(Doctor.objects.select_for_update().filter(pk__in=affected).order_by('pk').values_list('pk', flat=True))
+        existing = list(Reservation.objects.filter(
+            doctor_id__in=affected,
+            date__in={slot[1] for _, _, slot in targets},
+        ).values_list('doctor_id', 'date', 'time', 'id'))
+        accepted, rejected = self.resolve_slots(targets, existing, moves, cancels)
+        for operation, index in rejected:
+            self.fail(operation, index, {'time': ['This time slot is already reserved.']})
+        creates = [(index, data) for index, data in creates if ('create', index) in accepted]
+        moves = [(index, data) for index, data in moves if ('move', index) in accepted]
+
+        moved = []
+        booked_at = {}
+        for _, data in moves:
+            reservation = reservations[data['id']]
+            reservation.date, reservation.time = data['date'], data['time']
+            booked_at[reservation.id] = reservation.reservation_time
+            moved.append(reservation)
+        created = [
+            Reservation(doctor_id=data['doctor'], patient_id=data['patient'], date=data['date'], time=data['time'])
+            for _, data in creates
+        ]
+
+        # Moved rows are deleted and re-inserted rather than updated in place, so a batch that
+        # shifts a whole day or swaps two slots never trips the (doctor, date, time) constraint
+        # halfway through a statement.
+        Reservation.objects.filter(id__in=[data['id'] for _, data in moves + cancels]).delete()
+        Reservation.objects.bulk_create(moved + created, batch_size=500)
+        # bulk_create stamps reservation_time (auto_now_add); put the original booking time back
+        for reservation in moved:
+            reservation.reservation_time = booked_at[reservation.id]
+        Reservation.objects.bulk_update(moved, ['reservation_time'], batch_size=500)
+
+        for index, data in cancels:
+            self.succeed('cancel', index, 'cancelled', data['id'])
+        for index, data in moves:
+            self.succeed('move', index, 'moved', data['id'])
+        for (index, _), reservation in zip(creates, created):
+            self.succeed('create', index, 'created', reservation.id)
+        return self.results
+
+    @staticmethod
+    def resolve_slots(targets, existing, moves, cancels):
+        """Decide which creates/moves get their slot, creates first and each in request order.
+
+        Slots held by reservations that this batch moves or cancels count as free, but a move
+        that is itself rejected keeps its old slot, so repeat until no more moves drop out.
+        """
+        cancelled = {data['id'] for _, data in cancels}
+        moving = {data['id']: index for index, data in moves}
+        while True:
+            taken = {
+                (doctor, date, time) for doctor, date, time, pk in existing
+                if pk not in cancelled and pk not in moving
+            }
+            moving_indexes = set(moving.values())
+            accepted, rejected = set(), []
+            for operation, index, slot in targets:
+                if slot in taken or (operation == 'move' and index not in moving_indexes):
+                    rejected.append((operation, index))
+                else:
+                    taken.add(slot)
+                    accepted.add((operation, index))
+            dropped = [pk for pk, index in moving.items() if ('move', index) not in accepted]
+            if not dropped:
+                return accepted, rejected
+            for pk in dropped:
+                del moving[pk]
+
+
+class QueueBatch(Batch):
+    create_serializer_class = QueueBulkCreateSerializer
+    move_serializer_class = QueueBulkMoveSerializer
+    cancel_field = serializers.IntegerField()
+
+    def run(self):
+        creates = self.validate('create', self.create_serializer_class)
+        moves = self.validate('move', self.move_serializer_class)
+        cancels = self.validate_cancels()
+
+        creates = self.drop_other_doctors(creates)
+        doctors = set(Doctor.objects.filter(pk__in={data['doctor'] for _, data in creates}).values_list('pk', flat=True))
+        patients = set(Patient.objects.filter(pk__in={data['patient'] for _, data in creates}).values_list('pk', flat=True))
+        creates = self.drop_missing('create', creates, 'doctor', doctors, 'Doctor not found.')
+        creates = self.drop_missing('create', creates, 'patient', patients, 'Patient not found.')
+
+        with transaction.atomic():
+            # Lock every doctor whose queue changes, then read the entries under that lock, so a
+            # patient called or appended in the meantime is seen here rather than overwritten
+            appending = {data['doctor'] for _, data in creates if 'position' not in data}
+            touched = {data['id'] for _, data in moves + cancels}
+            affected = appending | set(self.scope(Queue.objects.filter(id__in=touched)).values_list('doctor_id', flat=True))
+            list(Doctor.objects.select_for_update().filter(pk__in=affected).order_by('pk').values_list('pk', flat=True))
+
+            entries = self.load(Queue.objects.select_for_update(), [moves, cancels])
+            moves = self.drop_missing('move', moves, 'id', entries, 'Queue entry not found.')
+            cancels = self.drop_missing('cancel', cancels, 'id', entries, 'Queue entry not found.')
+            self.check_touched_once(moves + cancels)
+
+            moved = []
+            for _, data in moves:
+                entry = entries[data['id']]
+                entry.position = data['position']
+                moved.append(entry)
+
+            last_positions = dict(
+                Queue.objects.filter(doctor_id__in=appending).values('doctor_id')
+                .annotate(last=Max('position')).values_list('doctor_id', 'last')
+            )
+            created = []
+            for _, data in creates:
+                position = data.get('position')
+                if position is None:
+                    position = last_positions.get(data['doctor'], 0) + 1
+                    last_positions[data['doctor']] = position
+                created.append(Queue(doctor_id=data['doctor'], patient_id=data['patient'], position=position))
+
+            remove_queue_entries([entries[data['id']] for _, data in cancels], QueueHistory.CANCELLED)
+            Queue.objects.bulk_update(moved, ['position'], batch_size=500)
+            Queue.objects.bulk_create(created, batch_size=500)
+
+        for index, data in cancels:
+            self.succeed('cancel', index, 'cancelled', data['id'])
+        for index, data in moves:
+            self.succeed('move', index, 'moved', data['id'])
+        for (index, _), entry in zip(creates, created):
+            self.results['create'][index] = {'index': index, 'status': 'created', 'id': entry.id, 'position': entry.position}
+        return self.results
@@ -0,0 +1,154 @@
+import csv
+import datetime
+import decimal
+import json
+import uuid
+
+from django.conf import settings
+from django.db.models import DateTimeField, F, OuterRef, Subquery, Value
+
+from .archive import history_querysets
+from .models import Patient, Queue, QueueHistory, Service
+
+FORMATS = ('csv', 'ndjson')
+
+RESERVATION_FIELDS = [
+    'id', 'date', 'time', 'reservation_time', 'doctor_id', 'doctor_name',
+    'patient_id', 'patient_username', 'type_of_insurance', 'services', 'archived',
+]
+QUEUE_FIELDS = [
+    'id', 'timestamp', 'position', 'doctor_id', 'doctor_name', 'patient_id',
+    'national_code', 'first_name', 'last_name', 'type_of_insurance', 'services', 'status', 'removed_at',
+]
+
+
+def get_batch_size():
+    return getattr(settings, 'EXPORT_BATCH_SIZE', 2000)
+
+
+def reservation_querysets(date_from=None, date_to=None, doctor=None):
+    # Reservation.patient points at the User, the insurance lives on that user's Patient record
+    insurance = Patient.objects.filter(user=OuterRef('patient')).values('type_of_insurance')[:1]
+    return [
+        queryset.annotate(type_of_insurance=Subquery(insurance)).values(
+            'id', 'date', 'time', 'reservation_time', 'doctor_id', 'type_of_insurance', 'archived',
+            'patient_id', patient_username=F('patient__username'), doctor_name=F('doctor__name'),
+        )
+        for queryset in history_querysets(date_from=date_from, date_to=date_to, doctor=doctor)
+    ]
+
+
+def queue_querysets(date_from=None, date_to=None, doctor=None):
+    # Waiting entries from Queue, then called/cancelled ones from QueueHistory
+    live = Queue.objects.annotate(
+        status=Value('waiting'), removed_at=Value(None, output_field=DateTimeField()),
+    )
+    removed = QueueHistory.objects.annotate(status=F('outcome'))
+    querysets = []
+    for queryset in (live, removed):
+        if date_from:
+            queryset = queryset.filter(timestamp__date__gte=date_from)
+        if date_to:
+            queryset = queryset.filter(timestamp__date__lte=date_to)
+        if doctor:
+            queryset = queryset.filter(doctor_id=doctor)
+        querysets.append(queryset.values(
+            'id', 'timestamp', 'position', 'doctor_id', 'patient_id', 'status', 'removed_at',
+            doctor_name=F('doctor__name'),
+            national_code=F('patient__national_code'),
+            first_name=F('patient__first_name'),
+            last_name=F('patient__last_name'),
+            type_of_insurance=F('patient__type_of_insurance'),
+        ))
+    return querysets
+
+
+def iter_keyset(queryset, batch_size):
+    """Walk a values() queryset in primary key order, one bounded query per batch."""
+    last_pk = None
+    while True:
+        page = queryset.order_by('id')
+        if last_pk is not None:
+            page = page.filter(id__gt=last_pk)
+        rows = list(page[:batch_size].iterator(chunk_size=batch_size))
+        if not rows:
+            return
+        yield rows
+        last_pk = rows[-1]['id']
+
+
+def attach_services(rows):
+    doctor_ids = {row['doctor_id'] for row in rows}
+    services = {}
+    for service in Service.objects.filter(doctor_id__in=doctor_ids).order_by('service_code').values(
+            'doctor_id', 'service_code', 'service_name', 'service_price', 'insurance_price').iterator():
+        services.setdefault(service.pop('doctor_id'), []).append(service)
+    for row in rows:
+        row['services'] = services.get(row['doctor_id'], [])
+    return rows
+
+
+EXPORTS = {
+    'reservations': (reservation_querysets, RESERVATION_FIELDS),
+    'queue': (queue_querysets, QUEUE_FIELDS),
+}
+
+
+def iter_rows(kind, batch_size=None, **filters):
+    querysets_factory, _ = EXPORTS[kind]
+    for queryset in querysets_factory(**filters):
+        for rows in iter_keyset(queryset, batch_size or get_batch_size()):
+            yield from attach_services(rows)
+
+
+def format_value(value):
+    # Shared by both writers so CSV and NDJSON agree: full-precision ISO 8601 for dates and
+    # times, strings for decimals and UUIDs, everything else left as its JSON type
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    if isinstance(value, list):
+        return [format_value(item) for item in value]
+    if isinstance(value, dict):
+        return {key: format_value(item) for key, item in value.items()}
+    return value
+
+
+def format_cell(value):
+    value = format_value(value)
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+class Echo:
+    # csv.writer only needs an object with write(); hand the formatted line straight back
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows, fields):
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow([format_cell(row[field]) for field in fields])
+
+
+def stream_ndjson(rows, fields):
+    for row in rows:
+        yield json.dumps({field: format_value(row[field]) for field in fields}, ensure_ascii=False) + '\n'
+
+
+def stream_export(kind, fmt, batch_size=None, **filters):
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported format '{fmt}', expected one of {', '.join(FORMATS)}")
+    _, fields = EXPORTS[kind]
+    rows = iter_rows(kind, batch_size=batch_size, **filters)
+    if fmt == 'csv':
+        return stream_csv(rows, fields)
+    return stream_ndjson(rows, fields)
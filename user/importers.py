@@ -0,0 +1,227 @@
+import csv
+import json
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, transaction
+
+from .models import Patient, PatientNameToken, NationalIDCard
+from .serializers import PatientImportSerializer, NationalIDCardImportSerializer
+
+User = get_user_model()
+
+FORMATS = ('csv', 'ndjson')
+
+
+def get_batch_size():
+    return getattr(settings, 'BULK_IMPORT_BATCH_SIZE', 1000)
+
+
+def decode_lines(lines, errors):
+    # Byte lines are decoded one at a time; an undecodable line is recorded and replaced by a
+    # blank one so the readers below skip it and line numbers stay aligned
+    for line_number, line in enumerate(lines, start=1):
+        if isinstance(line, bytes):
+            try:
+                line = line.decode('utf-8-sig')
+            except UnicodeDecodeError as e:
+                errors.append((line_number, {'__error__': f'Invalid UTF-8: {e}'}))
+                line = '\n'
+        yield line
+
+
+def flush_errors(errors):
+    while errors:
+        yield errors.pop(0)
+
+
+def read_rows(lines, fmt):
+    """Yield (line_number, row) pairs from an iterable of text or UTF-8 byte lines.
+
+    Lines that cannot be decoded or parsed come back as {'__error__': message} rows.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported format '{fmt}', expected one of {', '.join(FORMATS)}")
+    errors = []
+    lines = decode_lines(lines, errors)
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        while True:
+            try:
+                row = next(reader)
+            except StopIteration:
+                break
+            except csv.Error as e:
+                row = {'__error__': f'Invalid CSV: {e}'}
+            yield from flush_errors(errors)
+            yield reader.line_num, row
+    else:
+        for line_number, line in enumerate(lines, start=1):
+            yield from flush_errors(errors)
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_number, {'__error__': f'Invalid JSON: {e}'}
+                continue
+            if not isinstance(row, dict):
+                row = {'__error__': 'Each line must be a JSON object.'}
+            yield line_number, row
+    yield from flush_errors(errors)
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.rejected = 0
+
+    def as_dict(self):
+        return {'created': self.created, 'rejected': self.rejected}
+
+
+class BaseImporter:
+    serializer_class = None
+    model = None
+    unique_field = None
+
+    def __init__(self, batch_size=None, on_reject=None):
+        self.batch_size = batch_size or get_batch_size()
+        self.on_reject = on_reject
+        self.result = ImportResult()
+
+    def run(self, lines, fmt):
+        for chunk in chunked(read_rows(lines, fmt), self.batch_size):
+            self.import_chunk(chunk)
+        return self.result
+
+    def reject(self, line_number, errors):
+        self.result.rejected += 1
+        if self.on_reject:
+            self.on_reject(line_number, errors)
+
+    def prepare_row(self, row):
+        return row
+
+    def validate_chunk(self, chunk):
+        valid = []
+        seen = set()
+        for line_number, row in chunk:
+            if '__error__' in row:
+                self.reject(line_number, {'non_field_errors': [row['__error__']]})
+                continue
+            serializer = self.serializer_class(data=self.prepare_row(row))
+            if not serializer.is_valid():
+                self.reject(line_number, serializer.errors)
+                continue
+            key = serializer.validated_data[self.unique_field]
+            if key in seen:
+                self.reject(line_number, {self.unique_field: ['Duplicate value in import file.']})
+                continue
+            seen.add(key)
+            valid.append((line_number, serializer.validated_data))
+        return self.drop_existing(valid)
+
+    def drop_existing(self, valid):
+        keys = [data[self.unique_field] for _, data in valid]
+        lookup = {f'{self.unique_field}__in': keys}
+        existing = set(self.model.objects.filter(**lookup).values_list(self.unique_field, flat=True))
+        remaining = []
+        for line_number, data in valid:
+            if data[self.unique_field] in existing:
+                self.reject(line_number, {self.unique_field: [f'{self.model._meta.verbose_name} with this {self.unique_field} already exists.']})
+            else:
+                remaining.append((line_number, data))
+        return remaining
+
+    def import_chunk(self, chunk):
+        valid = self.validate_chunk(chunk)
+        if not valid:
+            return
+        try:
+            with transaction.atomic():
+                self.write(valid)
+        except IntegrityError as e:
+            # Rows written concurrently by someone else; report the batch instead of aborting the run
+            for line_number, _ in valid:
+                self.reject(line_number, {'non_field_errors': [f'Batch rejected: {e}']})
+            return
+        self.result.created += len(valid)
+
+    def write(self, valid):
+        raise NotImplementedError
+
+
+class PatientImporter(BaseImporter):
+    serializer_class = PatientImportSerializer
+    model = Patient
+    unique_field = 'national_code'
+
+    def prepare_row(self, row):
+        # Accept the nested shape used by PatientSerializer as well as flat CSV columns
+        user = row.get('user')
+        if isinstance(user, dict):
+            row = {**row, **user}
+            row.pop('user')
+        return row
+
+    def drop_existing(self, valid):
+        valid = super().drop_existing(valid)
+        usernames = [User.normalize_username(data['username']) for _, data in valid]
+        existing = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+        seen = set()
+        remaining = []
+        for line_number, data in valid:
+            username = User.normalize_username(data['username'])
+            if username in existing or username in seen:
+                self.reject(line_number, {'username': ['A user with that username already exists.']})
+                continue
+            seen.add(username)
+            data['username'] = username
+            remaining.append((line_number, data))
+        return remaining
+
+    def write(self, valid):
+        users = []
+        for _, data in valid:
+            password = data.pop('password', '')
+            user = User(username=data.pop('username'), is_doctor=False)
+            # Hashing is the expensive part of registration; rows without a password get an unusable one
+            user.password = make_password(password or None)
+            users.append(user)
+        users = User.objects.bulk_create(users, batch_size=self.batch_size)
+        patients = [Patient(user=user, **data) for user, (_, data) in zip(users, valid)]
+        for patient in patients:
+            patient.normalize_names()
+        Patient.objects.bulk_create(patients, batch_size=self.batch_size)
+        PatientNameToken.objects.bulk_create(PatientNameToken.for_patients(patients), batch_size=self.batch_size)
+
+
+class NationalIDCardImporter(BaseImporter):
+    serializer_class = NationalIDCardImportSerializer
+    model = NationalIDCard
+    unique_field = 'national_id'
+
+    def write(self, valid):
+        NationalIDCard.objects.bulk_create(
+            [NationalIDCard(**data) for _, data in valid],
+            batch_size=self.batch_size,
+        )
+
+
+IMPORTERS = {
+    'patients': PatientImporter,
+    'nationalidcards': NationalIDCardImporter,
+}
@@ -0,0 +1,23 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from user.archive import archive_reservations, get_archive_horizon
+
+
+class Command(BaseCommand):
+    help = ('Move reservations older than the archive horizon into the archive table. '
+            'Meant to be run from a daily scheduled task.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Archive reservations older than this many days '
+                                                     '(defaults to RESERVATION_ARCHIVE_AFTER_DAYS).')
+        parser.add_argument('--batch-size', type=int, default=None)
+
+    def handle(self, *args, **options):
+        if options['days'] is not None and options['days'] < 0:
+            raise CommandError('--days cannot be negative.')
+        horizon = datetime.timedelta(days=options['days']) if options['days'] is not None else get_archive_horizon()
+        before = datetime.date.today() - horizon
+        moved = archive_reservations(before=before, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Archived {moved} reservations dated before {before}."))
@@ -0,0 +1,41 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from user.importers import FORMATS, IMPORTERS
+
+
+class Command(BaseCommand):
+    help = 'Stream patients or national ID cards from a CSV/NDJSON file into the database in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(IMPORTERS))
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=FORMATS, help='Defaults to the file extension.')
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--rejects', help='Write rejected rows as NDJSON to this file instead of stderr.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        if fmt not in FORMATS:
+            raise CommandError(f"Cannot infer format from '{path}', pass --format.")
+
+        rejects = open(options['rejects'], 'w', encoding='utf-8') if options['rejects'] else self.stderr
+
+        def on_reject(line_number, errors):
+            rejects.write(json.dumps({'line': line_number, 'errors': errors}, ensure_ascii=False) + '\n')
+
+        importer = IMPORTERS[options['kind']](batch_size=options['batch_size'], on_reject=on_reject)
+        try:
+            # Read bytes so undecodable lines are reported as rejects instead of aborting the run
+            with open(path, 'rb') as f:
+                result = importer.run(f, fmt)
+        except ValueError as e:
+            raise CommandError(str(e))
+        finally:
+            if rejects is not self.stderr:
+                rejects.close()
+
+        self.stdout.write(self.style.SUCCESS(f"Created {result.created} rows, rejected {result.rejected}."))
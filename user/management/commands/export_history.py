@@ -0,0 +1,38 @@
+import argparse
+import datetime
+import sys
+
+from django.core.management.base import BaseCommand
+
+from user.exporters import EXPORTS, FORMATS, stream_export
+
+
+def parse_date(value):
+    try:
+        return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid date '{value}', expected YYYY-MM-DD.")
+
+
+class Command(BaseCommand):
+    help = 'Stream reservation or queue history as CSV/NDJSON in constant memory.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(EXPORTS))
+        parser.add_argument('--format', choices=FORMATS, default='csv')
+        parser.add_argument('--date-from', type=parse_date)
+        parser.add_argument('--date-to', type=parse_date)
+        parser.add_argument('--doctor', type=int)
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--output', help='Write to this file instead of stdout.')
+
+    def handle(self, *args, **options):
+        chunks = stream_export(
+            options['kind'], options['format'], batch_size=options['batch_size'],
+            date_from=options['date_from'], date_to=options['date_to'], doctor=options['doctor'],
+        )
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as f:
+                f.writelines(chunks)
+        else:
+            sys.stdout.writelines(chunks)
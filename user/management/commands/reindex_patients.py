@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from user.models import Patient, PatientNameToken
+
+
+class Command(BaseCommand):
+    help = 'Recompute the normalized name and name tokens used by patient search.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_pk = 0
+        updated = 0
+        while True:
+            patients = list(
+                Patient.objects.filter(pk__gt=last_pk).order_by('pk')
+                .only('first_name', 'last_name', 'name_normalized')[:batch_size]
+            )
+            if not patients:
+                break
+            for patient in patients:
+                patient.normalize_names()
+            with transaction.atomic():
+                Patient.objects.bulk_update(patients, ['name_normalized'])
+                PatientNameToken.objects.filter(patient__in=patients).delete()
+                PatientNameToken.objects.bulk_create(PatientNameToken.for_patients(patients))
+            updated += len(patients)
+            last_pk = patients[-1].pk
+        self.stdout.write(self.style.SUCCESS(f"Reindexed {updated} patients."))
@@ -0,0 +1,120 @@
+import secrets
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import compress_sequence, compress_string
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    'text/', 'application/json', 'application/x-ndjson', 'application/javascript', 'application/xml',
+)
+
+
+def accepted_encodings(header):
+    # Accept-Encoding: "br;q=1.0, gzip;q=0.8, *;q=0.1" -> {'br': 1.0, 'gzip': 0.8, '*': 0.1}
+    encodings = {}
+    for part in header.split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            encodings[name.strip().lower()] = quality
+    return encodings
+
+
+def brotli_padding(max_random_bytes):
+    # A metadata meta-block of 1..max_random_bytes random bytes, which decoders skip. Like the
+    # random gzip filename Django adds, it keeps the compressed length from leaking secrets (BREACH).
+    length = secrets.randbelow(min(max_random_bytes, 256)) + 1
+    # ISLAST=0, MNIBBLES=3 (metadata), reserved bit, MSKIPBYTES=1, then MSKIPLEN - 1 over 8 bits
+    header = 0b010110 | (length - 1) << 6
+    return bytes([header & 0xFF, header >> 8]) + secrets.token_bytes(length)
+
+
+def brotli_sequence(sequence, quality, max_random_bytes=0):
+    compressor = brotli.Compressor(quality=quality)
+    if max_random_bytes:
+        # Flushing the empty stream ends the header on a byte boundary, where a meta-block can go
+        yield compressor.process(b'') + compressor.flush() + brotli_padding(max_random_bytes)
+    for chunk in sequence:
+        data = compressor.process(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """GZipMiddleware with brotli negotiation, a configurable size threshold and a content type allowlist.
+
+    Brotli is only offered when the `brotli` package is installed and is padded like gzip. Streaming
+    responses are always compressed since their size is unknown up front.
+    """
+
+    max_random_bytes = 100
+    # Brotli's default (11) is meant for static assets and is far too slow per request
+    brotli_quality = 4
+
+    def choose_encoding(self, request):
+        encodings = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        candidates = ['br', 'gzip'] if brotli else ['gzip']
+        best = None
+        for name in candidates:
+            quality = encodings.get(name, encodings.get('*', 0.0))
+            if quality > 0 and (best is None or quality > best[1]):
+                best = (name, quality)
+        return best[0] if best else None
+
+    def process_response(self, request, response):
+        min_size = getattr(settings, 'COMPRESSION_MIN_SIZE', 1024)
+        if not response.streaming and len(response.content) < min_size:
+            return response
+        if response.has_header('Content-Encoding'):
+            return response
+        if not response.get('Content-Type', '').startswith(COMPRESSIBLE_TYPES):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        encoding = self.choose_encoding(request)
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                return response
+            if encoding == 'br':
+                response.streaming_content = brotli_sequence(
+                    response.streaming_content, self.brotli_quality, max_random_bytes=self.max_random_bytes,
+                )
+            else:
+                response.streaming_content = compress_sequence(
+                    response.streaming_content, max_random_bytes=self.max_random_bytes,
+                )
+            del response.headers['Content-Length']
+        else:
+            if encoding == 'br':
+                compressed_content = b''.join(brotli_sequence(
+                    [response.content], self.brotli_quality, max_random_bytes=self.max_random_bytes,
+                ))
+            else:
+                compressed_content = compress_string(response.content, max_random_bytes=self.max_random_bytes)
+            if len(compressed_content) >= len(response.content):
+                return response
+            response.content = compressed_content
+            response.headers['Content-Length'] = str(len(response.content))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
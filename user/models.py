@@ -1,9 +1,11 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
 from django.conf import settings
 import uuid
 import datetime
 
+from .utils import normalize_text
+
 
 class NationalIDCard(models.Model):
     national_id = models.CharField(max_length=10, unique=True)
@@ -56,11 +58,49 @@ class Patient(models.Model):
     date_of_birth = models.DateField()
     type_of_insurance = models.CharField(max_length=100)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    # Search key kept in sync by save(); bulk writers must call normalize_names() and
+    # PatientNameToken.for_patients() themselves
+    name_normalized = models.CharField(max_length=201, default='', editable=False)
+
+    def normalize_names(self):
+        self.name_normalized = normalize_text(f"{self.first_name} {self.last_name}")
+
+    def save(self, *args, **kwargs):
+        self.normalize_names()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'name_normalized'}
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            PatientNameToken.objects.filter(patient=self).delete()
+            PatientNameToken.objects.bulk_create(PatientNameToken.for_patients([self]))
 
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
 
 
+class PatientNameToken(models.Model):
+    # One row per word of a patient's normalized name, so any word can be matched by prefix
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='name_tokens', db_index=False)
+    token = models.CharField(max_length=100)
+
+    class Meta:
+        # (token, patient) walks a prefix range; (patient, token) answers "does this patient
+        # have a word starting with ..." from the index alone
+        indexes = [models.Index(fields=['token', 'patient']), models.Index(fields=['patient', 'token'])]
+
+    @classmethod
+    def for_patients(cls, patients):
+        return [
+            cls(patient=patient, token=token[:100])
+            for patient in patients
+            for token in dict.fromkeys(patient.name_normalized.split())
+        ]
+
+    def __str__(self):
+        return self.token
+
+
 class Doctor(models.Model):
     name = models.CharField(max_length=100, default='Unknown')
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
@@ -80,21 +120,61 @@ class Reservation(models.Model):
 
     class Meta:
         unique_together = ('doctor', 'date', 'time')
+        # Archiving and the history view walk all doctors by date
+        indexes = [models.Index(fields=['date', 'time'])]
 
     def __str__(self):
         return f"Reservation for {self.patient.username} with Dr. {self.doctor.user.username} on {self.date} at {self.time}"
 
 
+class ArchivedReservation(models.Model):
+    # Same shape as Reservation; rows are moved here by the archive_reservations command
+    id = models.UUIDField(primary_key=True, editable=False)
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE)
+    date = models.DateField()
+    time = models.TimeField()
+    patient = models.ForeignKey(User, on_delete=models.CASCADE)
+    reservation_time = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['doctor', 'date']), models.Index(fields=['date', 'time'])]
+
+    def __str__(self):
+        return f"Archived reservation for {self.patient.username} with Dr. {self.doctor.user.username} on {self.date} at {self.time}"
+
+
 class Queue(models.Model):
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE)
     doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE)
     position = models.PositiveIntegerField()
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [models.Index(fields=['doctor', 'position'])]
+
     def __str__(self):
         return f"Patient {self.patient} is in position {self.position} for Dr. {self.doctor}"
 
 
+class QueueHistory(models.Model):
+    # Queue entries removed when a patient is called or a bulk cancel runs; id is the original Queue id
+    CALLED = 'called'
+    CANCELLED = 'cancelled'
+    OUTCOMES = [(CALLED, 'Called'), (CANCELLED, 'Cancelled')]
+
+    id = models.BigIntegerField(primary_key=True)
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE)
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE)
+    position = models.PositiveIntegerField()
+    timestamp = models.DateTimeField()
+    removed_at = models.DateTimeField(auto_now_add=True)
+    outcome = models.CharField(max_length=10, choices=OUTCOMES)
+
+    def __str__(self):
+        return f"Patient {self.patient} was {self.outcome} at position {self.position} for Dr. {self.doctor}"
+
+
 class Service(models.Model):
     doctor = models.ForeignKey('Doctor', on_delete=models.CASCADE, related_name='services')
     service_code = models.CharField(max_length=20, unique=True)
@@ -0,0 +1,32 @@
+import io
+import re
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# orjson turns integers outside the 64-bit range into floats; anything with this many digits in a
+# row might be one, so it goes through the stdlib parser instead
+LONG_DIGIT_RUN = re.compile(rb'\d{19}')
+
+
+class FastJSONParser(JSONParser):
+    """JSONParser backed by orjson when it is installed (orjson only reads UTF-8)."""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower().replace('-', '') != 'utf8':
+            return super().parse(stream, media_type, parser_context)
+        data = stream.read()
+        if LONG_DIGIT_RUN.search(data):
+            return super().parse(io.BytesIO(data), media_type, parser_context)
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
@@ -0,0 +1,14 @@
+from rest_framework.permissions import BasePermission
+
+
+def is_doctor(user):
+    # Doctor is a reverse one-to-one; users without one raise RelatedObjectDoesNotExist (an AttributeError)
+    return hasattr(user, 'doctor')
+
+
+class IsAdminOrDoctor(BasePermission):
+    """Admins, and doctors acting on their own schedule; views scope doctors to their own rows."""
+
+    def has_permission(self, request, view):
+        user = request.user
+        return bool(user and user.is_authenticated and (user.is_staff or is_doctor(user)))
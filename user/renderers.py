@@ -0,0 +1,68 @@
+import decimal
+import math
+from itertools import chain, compress, repeat
+from operator import is_
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+SCALAR_TYPES = frozenset({str, int, bool, type(None)})
+
+
+def has_unmatched_float(data):
+    """True if data holds a float that orjson would write differently from json.dumps.
+
+    orjson writes NaN and infinity as null, and formats exponents its own way (1e16 and
+    0.00001 where json.dumps writes 1e+16 and 1e-05). The data is walked one nesting level
+    at a time and split by type with map/compress, so rows of scalars never hit a Python loop.
+    """
+    level = [data]
+    while level:
+        types = list(map(type, level))
+        found = set(types) - SCALAR_TYPES
+        next_level = []
+        for cls in found:
+            items = compress(level, map(is_, types, repeat(cls)))
+            if issubclass(cls, dict):
+                next_level.extend(chain.from_iterable(map(dict.values, items)))
+            elif issubclass(cls, (list, tuple)):
+                next_level.extend(chain.from_iterable(items))
+            elif issubclass(cls, (float, decimal.Decimal)):
+                for value in map(float, items):
+                    if not math.isfinite(value) or 'e' in repr(value):
+                        return True
+        level = next_level
+    return False
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer backed by orjson when it is installed.
+
+    Output matches JSONRenderer: dates, decimals and anything else orjson does not handle
+    natively go through DRF's encoder, and indented or ASCII-only output is left to the parent class.
+    """
+    options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME if orjson else 0
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.ensure_ascii or not self.compact or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=JSONEncoder().default, option=self.options)
+        except orjson.JSONEncodeError:
+            # e.g. integers wider than 64 bits
+            return super().render(data, accepted_media_type, renderer_context)
+        # The parent raises on NaN in strict mode and formats exponents its own way
+        if has_unmatched_float(data):
+            return super().render(data, accepted_media_type, renderer_context)
+        # Escape the two line separators JSON allows but JavaScript does not, as JSONRenderer does
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
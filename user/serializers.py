@@ -1,5 +1,8 @@
 from rest_framework import serializers
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import QuerySet
 from django.contrib.auth import get_user_model
+from django.contrib.auth.validators import UnicodeUsernameValidator
 from .models import Patient, Doctor, Queue, Specialty, Reservation, NationalIDCard, Service
 import datetime
 import base64
@@ -20,10 +23,62 @@ class UserSerializer(serializers.ModelSerializer):
         user = User.objects.create_user(**validated_data)
         return user
 
+# Read-only list serializer that reads plain .values() rows for large querysets
+class FastListSerializer(serializers.ListSerializer):
+    passthrough_fields = (
+        serializers.CharField, serializers.IntegerField, serializers.BooleanField, serializers.FloatField,
+    )
+
+    def get_columns(self):
+        # (name, column, converter) per readable field, or None if any field needs a model instance
+        columns = []
+        model = self.child.Meta.model
+        for field in self.child._readable_fields:
+            if len(field.source_attrs) != 1:
+                return None
+            try:
+                model_field = model._meta.get_field(field.source)
+            except FieldDoesNotExist:
+                return None
+            if model_field.many_to_many or model_field.one_to_many:
+                return None
+            column = model_field.attname
+            if type(field) is serializers.PrimaryKeyRelatedField and field.pk_field is None:
+                converter = None
+            elif type(field) in self.passthrough_fields:
+                converter = None
+            elif isinstance(field, serializers.FileField):
+                converter = self.file_converter(field, model_field)
+            elif isinstance(field, (serializers.RelatedField, serializers.BaseSerializer,
+                                    serializers.SerializerMethodField)):
+                return None
+            else:
+                converter = field.to_representation
+            columns.append((field.field_name, column, converter))
+        return columns
+
+    @staticmethod
+    def file_converter(field, model_field):
+        def convert(name):
+            return field.to_representation(model_field.attr_class(None, model_field, name) if name else None)
+        return convert
+
+    def to_representation(self, data):
+        columns = self.get_columns() if isinstance(data, QuerySet) else None
+        if columns is None:
+            return super().to_representation(data)
+        rows = data.values_list(*[column for _, column, _ in columns])
+        return [
+            {name: value if converter is None or value is None else converter(value)
+             for (name, _, converter), value in zip(columns, row)}
+            for row in rows
+        ]
+
 class ServicePublicSerializer(serializers.ModelSerializer):
     class Meta:
         model = Service
         fields = ['service_name', 'service_image']
+        list_serializer_class = FastListSerializer
 
 # Patient serializer
 class PatientSerializer(serializers.ModelSerializer):
@@ -39,6 +94,12 @@ class PatientSerializer(serializers.ModelSerializer):
         patient = Patient.objects.create(user=user, **validated_data)
         return patient
 
+# Patient search result serializer
+class PatientSearchSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Patient
+        fields = ['id', 'national_code', 'first_name', 'last_name', 'date_of_birth', 'type_of_insurance']
+
 # Doctor serializer
 class DoctorSerializer(serializers.ModelSerializer):
     user = UserSerializer()
@@ -70,6 +131,7 @@ class QueueSerializer(serializers.ModelSerializer):
     class Meta:
         model = Queue
         fields = '__all__'
+        list_serializer_class = FastListSerializer
 
 # Reservation serializer
 class ReservationSerializer(serializers.ModelSerializer):
@@ -110,3 +172,38 @@ class Base64ImageField(serializers.ImageField):
 # Image upload serializer
 class ImageUploadSerializer(serializers.Serializer):
     image = Base64ImageField(max_length=None, use_url=True)
+
+# Bulk import serializers (uniqueness is checked per chunk by user.importers)
+class PatientImportSerializer(serializers.ModelSerializer):
+    username = serializers.CharField(max_length=150, validators=[UnicodeUsernameValidator()])
+    password = serializers.CharField(required=False, allow_blank=True, write_only=True)
+
+    class Meta:
+        model = Patient
+        exclude = ['user']
+        extra_kwargs = {'national_code': {'validators': []}}
+
+class NationalIDCardImportSerializer(NationalIDCardSerializer):
+    class Meta(NationalIDCardSerializer.Meta):
+        extra_kwargs = {'national_id': {'validators': []}}
+
+# Bulk reservation/queue item serializers (related rows are checked per batch by user.bulk)
+class ReservationBulkCreateSerializer(serializers.Serializer):
+    doctor = serializers.IntegerField()
+    patient = serializers.IntegerField()
+    date = serializers.DateField()
+    time = serializers.TimeField()
+
+class ReservationBulkMoveSerializer(serializers.Serializer):
+    id = serializers.UUIDField()
+    date = serializers.DateField()
+    time = serializers.TimeField()
+
+class QueueBulkCreateSerializer(serializers.Serializer):
+    doctor = serializers.IntegerField()
+    patient = serializers.IntegerField()
+    position = serializers.IntegerField(min_value=0, required=False)
+
+class QueueBulkMoveSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    position = serializers.IntegerField(min_value=0)
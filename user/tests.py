@@ -1,3 +1,903 @@
-from django.test import TestCase
+import base64
+import csv
+import datetime
+import decimal
+import gzip
+import io
+import json
+import uuid
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from PIL import Image
+
+from user.archive import archive_reservations
+from user.bulk import QueueBatch, ReservationBatch
+from user.middleware import CompressionMiddleware, brotli
+from user.views import search_patients_by_name
+from user.parsers import FastJSONParser
+from user.renderers import FastJSONRenderer
+from user.serializers import QueueSerializer, ServicePublicSerializer
+from user.exporters import stream_export
+from user.importers import PatientImporter, NationalIDCardImporter
+from user.utils import is_valid_national_code, find_national_code
+from user.models import (
+    User, Patient, NationalIDCard, Doctor, Reservation, ArchivedReservation, Queue, QueueHistory, Service,
+)
+
+
+PATIENT_HEADER = b'first_name,last_name,national_code,date_of_birth,type_of_insurance,username,password\n'
+
+
+def patient_line(i):
+    return f'Ali,Rezaei,{i:010d},1990-01-01,tamin,user{i},\n'.encode()
+
+
+class BulkImportTests(TestCase):
+    def run_import(self, importer_class, lines, fmt, batch_size=None):
+        rejects = []
+        importer = importer_class(batch_size=batch_size, on_reject=lambda line, errors: rejects.append((line, errors)))
+        return importer.run(lines, fmt), rejects
+
+    def test_patients_are_created_in_batches(self):
+        lines = [PATIENT_HEADER] + [patient_line(i) for i in range(5)]
+        result, rejects = self.run_import(PatientImporter, lines, 'csv', batch_size=2)
+        self.assertEqual(result.as_dict(), {'created': 5, 'rejected': 0})
+        self.assertEqual(rejects, [])
+        patient = Patient.objects.get(national_code='0000000003')
+        self.assertEqual(patient.user.username, 'user3')
+        self.assertFalse(patient.user.has_usable_password())
+
+    def test_duplicates_and_existing_rows_are_rejected(self):
+        self.run_import(PatientImporter, [PATIENT_HEADER, patient_line(1)], 'csv')
+        lines = [PATIENT_HEADER, patient_line(1), patient_line(2), patient_line(2)]
+        result, rejects = self.run_import(PatientImporter, lines, 'csv')
+        self.assertEqual(result.as_dict(), {'created': 1, 'rejected': 2})
+        self.assertEqual(sorted(line for line, _ in rejects), [2, 4])
+
+    def test_undecodable_line_is_rejected_without_stopping_the_run(self):
+        lines = [PATIENT_HEADER, patient_line(1), b'Ali,\xff\xfe,0000000002,1990-01-01,tamin,user2,\n', patient_line(3)]
+        result, rejects = self.run_import(PatientImporter, lines, 'csv')
+        self.assertEqual(result.as_dict(), {'created': 2, 'rejected': 1})
+        self.assertEqual(rejects[0][0], 3)
+        self.assertIn('Invalid UTF-8', rejects[0][1]['non_field_errors'][0])
+
+    def test_malformed_csv_row_is_rejected(self):
+        oversized = b'x' * 200000
+        lines = [PATIENT_HEADER, patient_line(1), b'"' + oversized + b'",b,0000000002,1990-01-01,t,u2,\n', patient_line(3)]
+        result, rejects = self.run_import(PatientImporter, lines, 'csv')
+        self.assertEqual(result.created, 2)
+        self.assertEqual(result.rejected, 1)
+        self.assertIn('Invalid CSV', rejects[0][1]['non_field_errors'][0])
+
+    def test_ndjson_national_id_cards(self):
+        lines = [
+            '{"national_id": "0499370899", "first_name": "a", "last_name": "b", "father_name": "c", "birth_date": "1990-01-01"}\n',
+            'not json\n',
+            '[1, 2]\n',
+            '{"national_id": "0499370899", "first_name": "a", "last_name": "b", "father_name": "c", "birth_date": "1990-01-01"}\n',
+        ]
+        result, rejects = self.run_import(NationalIDCardImporter, lines, 'ndjson')
+        self.assertEqual(result.as_dict(), {'created': 1, 'rejected': 3})
+        self.assertEqual([line for line, _ in rejects], [2, 3, 4])
+        self.assertTrue(NationalIDCard.objects.filter(national_id='0499370899').exists())
+
+    def test_endpoint_reports_bad_bytes_as_rejects(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        client = APIClient()
+        client.force_authenticate(admin)
+        data = PATIENT_HEADER + patient_line(1) + b'\xff\xff\xff\n' + patient_line(2)
+        response = client.post('/user/api/import/patients/', {'file': SimpleUploadedFile('p.csv', data)}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['created'], 2)
+        self.assertEqual(response.json()['rejected'], 1)
+        self.assertEqual(response.json()['rejected_rows'][0]['line'], 3)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        lines = [PATIENT_HEADER] + [patient_line(i) for i in range(3)]
+        PatientImporter().run(lines, 'csv')
+        self.patients = list(Patient.objects.order_by('national_code'))
+        self.doctor = Doctor.objects.create(user=User.objects.create(username='doc'), name='Dr A')
+        Service.objects.create(doctor=self.doctor, service_code='S1', service_name='visit',
+                               service_price='10.50', insurance_price='3.25')
+        for i, patient in enumerate(self.patients):
+            Reservation.objects.create(doctor=self.doctor, patient=patient.user,
+                                       date=datetime.date(2024, 1, 1 + i), time=datetime.time(9))
+            Queue.objects.create(doctor=self.doctor, patient=patient, position=i + 1)
+        Reservation.objects.update(reservation_time=datetime.datetime(2024, 1, 1, 8, 0, 0, 123456, tzinfo=datetime.timezone.utc))
+        archive_reservations(before=datetime.date(2024, 1, 2))
+
+    def export(self, kind, fmt, **filters):
+        body = ''.join(stream_export(kind, fmt, batch_size=2, **filters))
+        if fmt == 'csv':
+            return list(csv.DictReader(io.StringIO(body)))
+        return [json.loads(line) for line in body.splitlines()]
+
+    def test_imported_patients_round_trip_through_the_queue_export(self):
+        rows = self.export('queue', 'ndjson')
+        self.assertEqual([row['national_code'] for row in rows], [p.national_code for p in self.patients])
+        self.assertEqual({row['type_of_insurance'] for row in rows}, {'tamin'})
+        self.assertEqual(rows[0]['services'], [
+            {'service_code': 'S1', 'service_name': 'visit', 'service_price': '10.50', 'insurance_price': '3.25'},
+        ])
+
+    def test_import_and_export_endpoints_round_trip(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        client = APIClient()
+        client.force_authenticate(admin)
+        data = PATIENT_HEADER + 'زهرا,محمدی,0499370899,1990-01-01,salamat,zahra,\n'.encode()
+        response = client.post('/user/api/import/patients/', {'file': SimpleUploadedFile('p.csv', data)}, format='multipart')
+        self.assertEqual(response.json()['created'], 1)
+        Queue.objects.create(doctor=self.doctor, patient=Patient.objects.get(national_code='0499370899'), position=9)
+
+        response = client.get('/user/api/export/queue/csv/', {'doctor': self.doctor.id})
+        self.assertEqual(response.status_code, 200)
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        row = rows[-1]
+        self.assertEqual(
+            (row['national_code'], row['first_name'], row['last_name'], row['type_of_insurance'], row['position']),
+            ('0499370899', 'زهرا', 'محمدی', 'salamat', '9'),
+        )
+
+    def test_csv_and_ndjson_format_values_the_same_way(self):
+        csv_rows = self.export('reservations', 'csv')
+        json_rows = self.export('reservations', 'ndjson')
+        self.assertEqual(len(csv_rows), 3)
+        for csv_row, json_row in zip(csv_rows, json_rows):
+            self.assertEqual(csv_row['reservation_time'], '2024-01-01T08:00:00.123456+00:00')
+            self.assertEqual(json_row['reservation_time'], csv_row['reservation_time'])
+            self.assertEqual(csv_row['archived'], 'true' if json_row['archived'] else 'false')
+            self.assertEqual(json.loads(csv_row['services']), json_row['services'])
+            self.assertEqual(csv_row['date'], json_row['date'])
+
+    def test_reservation_export_includes_archived_rows_and_filters(self):
+        rows = self.export('reservations', 'ndjson')
+        self.assertEqual([row['archived'] for row in rows], [False, False, True])
+        rows = self.export('reservations', 'ndjson', date_from=datetime.date(2024, 1, 2))
+        self.assertEqual(sorted(row['date'] for row in rows), ['2024-01-02', '2024-01-03'])
+
+    def test_called_patients_stay_in_the_queue_export(self):
+        client = APIClient()
+        client.force_authenticate(self.doctor.user)
+        response = client.get(f'/user/queue/next/{self.doctor.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Queue.objects.count(), 2)
+        called = QueueHistory.objects.get()
+        self.assertEqual((called.patient, called.position, called.outcome), (self.patients[0], 1, QueueHistory.CALLED))
+
+        rows = self.export('queue', 'csv')
+        self.assertEqual([row['status'] for row in rows], ['waiting', 'waiting', 'called'])
+        self.assertEqual(rows[2]['national_code'], self.patients[0].national_code)
+        self.assertNotEqual(rows[2]['removed_at'], '')
+        self.assertEqual(rows[0]['removed_at'], '')
+
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.doctors = [Doctor.objects.create(user=User.objects.create(username=f'doc{i}'), name=f'Dr {i}') for i in range(2)]
+        self.patient = User.objects.create(username='patient')
+        self.today = datetime.date.today()
+
+    def book(self, days_ago, hour=9, doctor=0):
+        return Reservation.objects.create(doctor=self.doctors[doctor], patient=self.patient,
+                                          date=self.today - datetime.timedelta(days=days_ago), time=datetime.time(hour))
+
+    def test_reservations_are_archived_in_batches(self):
+        old = [self.book(10, hour, doctor) for hour in (9, 10) for doctor in (0, 1)] + [self.book(9)]
+        kept = self.book(1)
+        with CaptureQueriesContext(connection) as queries:
+            moved = archive_reservations(before=self.today - datetime.timedelta(days=5), batch_size=2)
+        self.assertEqual(moved, 5)
+        batches = [q for q in queries if q['sql'].startswith('SELECT') and 'ORDER BY' in q['sql']]
+        self.assertEqual(len(batches), 4)
+        self.assertEqual(list(Reservation.objects.all()), [kept])
+        archived = ArchivedReservation.objects.in_bulk()
+        self.assertEqual(set(archived), {reservation.id for reservation in old})
+        for reservation in old:
+            row = archived[reservation.id]
+            self.assertEqual((row.doctor_id, row.date, row.time, row.reservation_time),
+                             (reservation.doctor_id, reservation.date, reservation.time, reservation.reservation_time))
+
+    def test_command_days_option(self):
+        self.book(10)
+        self.book(3)
+        self.book(0)
+        out = io.StringIO()
+        call_command('archive_reservations', days=5, stdout=out)
+        self.assertIn('Archived 1 reservations', out.getvalue())
+        with override_settings(RESERVATION_ARCHIVE_AFTER_DAYS=2):
+            call_command('archive_reservations', stdout=io.StringIO())
+        self.assertEqual(ArchivedReservation.objects.count(), 2)
+        self.assertEqual(Reservation.objects.get().date, self.today)
+        with self.assertRaises(CommandError):
+            call_command('archive_reservations', days=-1, stdout=io.StringIO())
+
+    def test_history_merges_live_and_archived_rows(self):
+        archived_late = self.book(10, hour=11)
+        archived_early = self.book(10, hour=9, doctor=1)
+        live = self.book(1)
+        archive_reservations(before=self.today - datetime.timedelta(days=5))
+        # Booked after the archive run, so an old date is still in the live table
+        live_old = self.book(10, hour=10)
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        client = APIClient()
+        client.force_authenticate(admin)
+
+        response = client.get('/user/reservations/history/')
+        self.assertEqual(response.status_code, 200)
+        rows = response.json()['reservations']
+        self.assertEqual([(row['time'], row['archived']) for row in rows],
+                         [('09:00:00', False), ('11:00:00', True), ('10:00:00', False), ('09:00:00', True)])
+        self.assertEqual([row['id'] for row in rows],
+                         [str(r.id) for r in (live, archived_late, live_old, archived_early)])
+
+        rows = client.get('/user/reservations/history/', {'limit': '2'}).json()['reservations']
+        self.assertEqual(len(rows), 2)
+        rows = client.get('/user/reservations/history/', {'doctor': self.doctors[1].id}).json()['reservations']
+        self.assertEqual([row['id'] for row in rows], [str(archived_early.id)])
+        date_to = str(self.today - datetime.timedelta(days=5))
+        rows = client.get('/user/reservations/history/', {'date_to': date_to}).json()['reservations']
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(client.get('/user/reservations/history/', {'date_from': 'x'}).status_code, 400)
+        self.assertEqual(client.get('/user/reservations/history/', {'limit': '-1'}).status_code, 400)
+
+        client.force_authenticate(self.patient)
+        self.assertEqual(client.get('/user/reservations/history/').status_code, 403)
+
+
+class PatientSearchTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user('staff', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+        self.seyed = self.create_patient('سيد علي', 'كريمي', '0499370899')
+        self.mohammadreza = self.create_patient('محمد\u200cرضا', 'احمدی', '0012345679')
+        self.reza = self.create_patient('رضا', 'نوری', '1234567891')
+
+    def create_patient(self, first_name, last_name, national_code):
+        return Patient.objects.create(
+            first_name=first_name, last_name=last_name, national_code=national_code,
+            date_of_birth='1990-01-01', type_of_insurance='t',
+            user=User.objects.create(username=f'u{national_code}'),
+        )
+
+    def search(self, q):
+        response = self.client.get('/user/patients/search/', {'q': q})
+        self.assertEqual(response.status_code, 200)
+        return {row['id'] for row in response.json()}
+
+    def test_any_word_of_a_multi_word_first_name_matches(self):
+        for q in ['سید علی', 'علی', 'سید علی کریمی', 'علی کری', 'کریمی سی']:
+            self.assertEqual(self.search(q), {self.seyed.id}, q)
+
+    def test_zwnj_names_match_joined_split_and_by_inner_word(self):
+        for q in ['محمد\u200cرضا', 'محمد رضا', 'احمدی محمد']:
+            self.assertEqual(self.search(q), {self.mohammadreza.id}, q)
+        self.assertEqual(self.search('رضا'), {self.mohammadreza.id, self.reza.id})
+
+    def test_every_word_must_match(self):
+        self.assertEqual(self.search('علی نوری'), set())
+        self.assertEqual(self.search('زهرا'), set())
+
+    def test_word_order_does_not_matter(self):
+        self.assertEqual(self.search('کریمی سید'), self.search('سید کریمی'))
+
+    def test_a_word_matching_nothing_stops_the_search(self):
+        with self.assertNumQueries(2):
+            self.assertEqual(search_patients_by_name('علی zzz', 20), [])
+
+    def test_scan_limit_bounds_the_walk(self):
+        for i in range(3):
+            self.create_patient('کیان', 'پاکزاد', f'99999999{i}{i}')
+        with override_settings(PATIENT_SEARCH_SCAN_LIMIT=2):
+            # Both words reach the cap, so only the first two tokens of the longer one are walked
+            self.assertEqual(len(search_patients_by_name('کیان پاکزاد', 20)), 2)
+        self.assertEqual(len(search_patients_by_name('کیان پاکزاد', 20)), 3)
+
+    def test_arabic_letters_and_digits_are_normalized(self):
+        self.assertEqual(self.search('كريمي'), {self.seyed.id})
+        self.assertEqual(self.search('۰۰۱۲'), {self.mohammadreza.id})
+        self.assertEqual(self.search('12345'), {self.reza.id})
+
+    def test_renaming_a_patient_updates_its_tokens(self):
+        self.reza.first_name = 'زهرا'
+        self.reza.save()
+        self.assertEqual(self.search('زهرا'), {self.reza.id})
+        self.assertEqual(self.search('رضا'), {self.mohammadreza.id})
+
+    def test_imported_patients_are_searchable(self):
+        PatientImporter().run([PATIENT_HEADER, 'سید,حسینی,0000000009,1990-01-01,t,imported,\n'.encode()], 'csv')
+        self.assertEqual(len(self.search('حسینی')), 1)
+        self.assertEqual(self.search('سید'), {self.seyed.id, Patient.objects.get(national_code='0000000009').id})
+
+
+class ReservationBatchTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.doctor = Doctor.objects.create(user=User.objects.create(username='doc'), name='Dr A')
+        self.patient = User.objects.create(username='patient')
+        self.day = datetime.date(2024, 1, 1)
+
+    def book(self, hour):
+        return Reservation.objects.create(doctor=self.doctor, patient=self.patient, date=self.day, time=datetime.time(hour))
+
+    def create_item(self, hour):
+        return {'doctor': self.doctor.id, 'patient': self.patient.id, 'date': '2024-01-01', 'time': f'{hour:02d}:00'}
+
+    def post(self, data, user=None):
+        if user:
+            self.client.force_authenticate(user)
+        return self.client.post('/user/reservations/bulk/', data, format='json')
+
+    def test_patients_cannot_run_batches(self):
+        reservation = self.book(9)
+        self.client.force_authenticate(self.patient)
+        self.assertEqual(self.post({'cancel': [str(reservation.id)]}).status_code, 403)
+        self.assertEqual(self.client.post('/user/queue/bulk/', {'cancel': [1]}, format='json').status_code, 403)
+        self.client.logout()
+        self.assertEqual(self.post({'cancel': [str(reservation.id)]}).status_code, 401)
+        self.assertTrue(Reservation.objects.filter(pk=reservation.pk).exists())
+
+    def test_doctors_may_only_touch_their_own_reservations(self):
+        other = Doctor.objects.create(user=User.objects.create(username='other'), name='Dr B')
+        own = self.book(9)
+        foreign = Reservation.objects.create(doctor=other, patient=self.patient, date=self.day, time=datetime.time(9))
+        foreign_moved = Reservation.objects.create(doctor=other, patient=self.patient, date=self.day, time=datetime.time(10))
+        response = self.post({
+            'create': [self.create_item(11), {**self.create_item(11), 'doctor': other.id}],
+            'move': [{'id': str(own.id), 'date': '2024-01-01', 'time': '12:00'},
+                     {'id': str(foreign_moved.id), 'date': '2024-01-01', 'time': '13:00'}],
+            'cancel': [str(foreign.id)],
+        }, user=self.doctor.user)
+        self.assertEqual(response.status_code, 200)
+        results = response.json()
+        self.assertEqual([item['status'] for item in results['create']], ['created', 'error'])
+        self.assertEqual(results['create'][1]['errors'], {'doctor': ['You can only manage your own schedule.']})
+        self.assertEqual([item['status'] for item in results['move']], ['moved', 'error'])
+        self.assertEqual(results['move'][1]['errors'], {'id': ['Reservation not found.']})
+        self.assertEqual(results['cancel'][0]['errors'], {'id': ['Reservation not found.']})
+        self.assertEqual(Reservation.objects.filter(doctor=other).count(), 2)
+        foreign_moved.refresh_from_db()
+        self.assertEqual(foreign_moved.time, datetime.time(10))
+
+        # Admins are not scoped
+        response = self.post({'cancel': [str(foreign.id)]}, user=self.admin)
+        self.assertEqual(response.json()['cancel'][0]['status'], 'cancelled')
+
+    def test_results_are_reported_per_item(self):
+        kept = self.book(9)
+        cancelled = self.book(10)
+        response = self.post({
+            'create': [self.create_item(10), self.create_item(9), {'doctor': 999, 'patient': self.patient.id,
+                                                                   'date': '2024-01-01', 'time': '11:00'}],
+            'move': [{'id': str(kept.id), 'date': 'soon', 'time': '12:00'}],
+            'cancel': [str(cancelled.id), '00000000-0000-0000-0000-000000000000'],
+        })
+        self.assertEqual(response.status_code, 200)
+        results = response.json()
+        self.assertEqual([item['status'] for item in results['create']], ['created', 'error', 'error'])
+        self.assertEqual(results['create'][1]['errors'], {'time': ['This time slot is already reserved.']})
+        self.assertEqual(results['create'][2]['errors'], {'doctor': ['Doctor not found.']})
+        self.assertIn('date', results['move'][0]['errors'])
+        self.assertEqual([item['status'] for item in results['cancel']], ['cancelled', 'error'])
+        self.assertEqual(
+            sorted(Reservation.objects.values_list('time', flat=True)), [datetime.time(9), datetime.time(10)],
+        )
+
+    def test_creates_win_over_moves_for_the_same_slot(self):
+        reservation = self.book(9)
+        response = self.post({
+            'create': [self.create_item(10)],
+            'move': [{'id': str(reservation.id), 'date': '2024-01-01', 'time': '10:00'}],
+        })
+        results = response.json()
+        self.assertEqual(results['create'][0]['status'], 'created')
+        self.assertEqual(results['move'][0]['status'], 'error')
+        reservation.refresh_from_db()
+        self.assertEqual(reservation.time, datetime.time(9))
+
+    def test_rotating_a_full_batch_of_slots(self):
+        count = 1000
+        slots = [(self.day + datetime.timedelta(days=i // 24), datetime.time(i % 24)) for i in range(count)]
+        Reservation.objects.bulk_create([
+            Reservation(doctor=self.doctor, patient=self.patient, date=date, time=time) for date, time in slots
+        ])
+        reservations = list(Reservation.objects.order_by('date', 'time'))
+        booked_at = {reservation.id: reservation.reservation_time for reservation in reservations}
+        moves = [
+            {'id': str(reservation.id), 'date': str(slots[(i + 1) % count][0]), 'time': str(slots[(i + 1) % count][1])}
+            for i, reservation in enumerate(reservations)
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post({'move': moves})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({item['status'] for item in response.json()['move']}, {'moved'})
+        self.assertLess(len(queries), 30)
+        for i, reservation in enumerate(reservations):
+            reservation.refresh_from_db()
+            self.assertEqual((reservation.date, reservation.time), slots[(i + 1) % count])
+            self.assertEqual(reservation.reservation_time, booked_at[reservation.id])
+
+    def test_slot_taken_concurrently_is_retried_and_reported(self):
+        resolve_slots = ReservationBatch.resolve_slots
+
+        def book_first(*args):
+            # Stands in for a booking committed by another request after the slots were read
+            Reservation.objects.create(doctor=self.doctor, patient=self.admin, date=self.day, time=datetime.time(9))
+            return resolve_slots(*args)
+
+        with mock.patch.object(ReservationBatch, 'resolve_slots', side_effect=book_first) as patched:
+            response = self.post({'create': [self.create_item(9), self.create_item(10)]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(patched.call_count, 3)
+        self.assertEqual([item['status'] for item in response.json()['create']], ['error', 'error'])
+        self.assertEqual(Reservation.objects.count(), 0)
+
+        calls = []
+
+        def book_once(*args):
+            if not calls:
+                Reservation.objects.create(doctor=self.doctor, patient=self.admin, date=self.day, time=datetime.time(9))
+            calls.append(args)
+            return resolve_slots(*args)
+
+        with mock.patch.object(ReservationBatch, 'resolve_slots', side_effect=book_once):
+            response = self.post({'create': [self.create_item(9), self.create_item(10)]})
+        self.assertEqual(len(calls), 2)
+        self.assertEqual([item['status'] for item in response.json()['create']], ['created', 'created'])
+
+
+
+class QueueBatchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        self.doctor = Doctor.objects.create(user=User.objects.create(username='doc'), name='Dr A')
+        self.other = Doctor.objects.create(user=User.objects.create(username='other'), name='Dr B')
+        self.patients = [
+            Patient.objects.create(first_name='a', last_name='b', national_code=f'{i:010d}', date_of_birth='1990-01-01',
+                                   type_of_insurance='t', user=User.objects.create(username=f'p{i}'))
+            for i in range(4)
+        ]
+
+    def enqueue(self, patient, position, doctor=None):
+        return Queue.objects.create(doctor=doctor or self.doctor, patient=self.patients[patient], position=position)
+
+    def post(self, data):
+        response = self.client.post('/user/queue/bulk/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_creates_append_after_the_last_position_unless_one_is_given(self):
+        self.enqueue(0, 5)
+        results = self.post({'create': [
+            {'doctor': self.doctor.id, 'patient': self.patients[1].id},
+            {'doctor': self.doctor.id, 'patient': self.patients[2].id, 'position': 2},
+            {'doctor': self.doctor.id, 'patient': self.patients[3].id},
+            {'doctor': self.other.id, 'patient': self.patients[1].id},
+        ]})['create']
+        self.assertEqual([(item['status'], item['position']) for item in results],
+                         [('created', 6), ('created', 2), ('created', 7), ('created', 1)])
+        self.assertEqual(Queue.objects.get(pk=results[2]['id']).patient, self.patients[3])
+
+    def test_moves_and_cancels(self):
+        moved = self.enqueue(0, 1)
+        cancelled = self.enqueue(1, 2)
+        results = self.post({'move': [{'id': moved.id, 'position': 9}], 'cancel': [cancelled.id]})
+        self.assertEqual(results['move'], [{'index': 0, 'status': 'moved', 'id': moved.id}])
+        self.assertEqual(results['cancel'], [{'index': 0, 'status': 'cancelled', 'id': cancelled.id}])
+        self.assertEqual(list(Queue.objects.values_list('id', 'position')), [(moved.id, 9)])
+        history = QueueHistory.objects.get()
+        self.assertEqual((history.id, history.patient, history.position, history.outcome),
+                         (cancelled.id, self.patients[1], 2, QueueHistory.CANCELLED))
+
+    def test_errors_are_reported_per_item(self):
+        entry = self.enqueue(0, 1)
+        results = self.post({
+            'create': [{'doctor': 999, 'patient': self.patients[1].id}, {'doctor': self.doctor.id, 'patient': 999},
+                       {'doctor': self.doctor.id, 'patient': self.patients[1].id, 'position': -1}],
+            'move': [{'id': 999, 'position': 1}, {'id': entry.id}],
+            'cancel': ['x', 999],
+        })
+        self.assertEqual([item['errors'] for item in results['create']], [
+            {'doctor': ['Doctor not found.']}, {'patient': ['Patient not found.']},
+            {'position': ['Ensure this value is greater than or equal to 0.']},
+        ])
+        self.assertEqual(results['move'][0]['errors'], {'id': ['Queue entry not found.']})
+        self.assertIn('position', results['move'][1]['errors'])
+        self.assertEqual(results['cancel'][1]['errors'], {'id': ['Queue entry not found.']})
+        self.assertIn('id', results['cancel'][0]['errors'])
+        self.assertEqual(list(Queue.objects.values_list('id', 'position')), [(entry.id, 1)])
+
+        response = self.client.post('/user/queue/bulk/', {'move': [{'id': entry.id, 'position': 2}], 'cancel': [entry.id]}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_patient_called_before_the_batch_writes_is_not_found(self):
+        called = self.enqueue(0, 1)
+        cancelled = self.enqueue(1, 2)
+        validate_cancels = QueueBatch.validate_cancels
+
+        def call_first_patient(batch):
+            # The doctor calls the next patient after the batch has validated its items
+            self.client.get(f'/user/queue/next/{self.doctor.id}/')
+            return validate_cancels(batch)
+
+        with mock.patch.object(QueueBatch, 'validate_cancels', autospec=True, side_effect=call_first_patient):
+            results = self.post({'move': [{'id': called.id, 'position': 5}], 'cancel': [cancelled.id]})
+        self.assertEqual(results['move'][0]['errors'], {'id': ['Queue entry not found.']})
+        self.assertEqual(results['cancel'][0]['status'], 'cancelled')
+        self.assertEqual(dict(QueueHistory.objects.values_list('id', 'outcome')),
+                         {called.id: QueueHistory.CALLED, cancelled.id: QueueHistory.CANCELLED})
+        self.assertEqual(QueueHistory.objects.get(pk=called.id).position, 1)
+
+    def test_entries_are_read_under_the_doctor_lock(self):
+        entry = self.enqueue(0, 1)
+        with CaptureQueriesContext(connection) as queries:
+            self.post({'cancel': [entry.id]})
+        sql = [query['sql'] for query in queries]
+        savepoint = next(i for i, query in enumerate(sql) if query.startswith('SAVEPOINT'))
+        doctor_lock = next(i for i, query in enumerate(sql) if query.startswith('SELECT "user_doctor"."id" AS "pk" FROM "user_doctor"'))
+        entries = [i for i, query in enumerate(sql) if query.startswith('SELECT "user_queue"."id", "user_queue"."patient_id"')]
+        self.assertEqual(len(entries), 1)
+        self.assertLess(savepoint, doctor_lock)
+        self.assertLess(doctor_lock, entries[0])
+
+    def test_doctors_only_touch_their_own_queue(self):
+        own = self.enqueue(0, 1)
+        foreign = self.enqueue(1, 1, doctor=self.other)
+        self.client.force_authenticate(self.doctor.user)
+        results = self.post({
+            'create': [{'doctor': self.other.id, 'patient': self.patients[2].id},
+                       {'doctor': self.doctor.id, 'patient': self.patients[2].id}],
+            'move': [{'id': own.id, 'position': 3}],
+            'cancel': [foreign.id],
+        })
+        self.assertEqual(results['create'][0]['errors'], {'doctor': ['You can only manage your own schedule.']})
+        self.assertEqual(results['create'][1]['position'], 2)
+        self.assertEqual(results['move'][0]['status'], 'moved')
+        self.assertEqual(results['cancel'][0]['errors'], {'id': ['Queue entry not found.']})
+        self.assertTrue(Queue.objects.filter(pk=foreign.pk).exists())
+
+
+class ResolveSlotsTests(SimpleTestCase):
+    A, B, C = 'a', 'b', 'c'
+
+    def slot(self, minute):
+        return (1, datetime.date(2024, 1, 1), datetime.time(minute // 60, minute % 60))
+
+    def resolve(self, existing, creates=(), moves=(), cancels=()):
+        # Slots are given as minutes past midnight; creates: [slot], moves: [(pk, slot)], cancels: [pk]
+        targets = [('create', index, self.slot(slot)) for index, slot in enumerate(creates)]
+        targets += [('move', index, self.slot(slot)) for index, (_, slot) in enumerate(moves)]
+        existing = [(*self.slot(slot), pk) for pk, slot in existing.items()]
+        moves = [(index, {'id': pk}) for index, (pk, _) in enumerate(moves)]
+        cancels = [(index, {'id': pk}) for index, pk in enumerate(cancels)]
+        accepted, rejected = ReservationBatch.resolve_slots(targets, existing, moves, cancels)
+        self.assertFalse(accepted & set(rejected))
+        return accepted, rejected
+
+    def test_two_reservations_can_swap(self):
+        accepted, rejected = self.resolve({self.A: 9, self.B: 10}, moves=[(self.A, 10), (self.B, 9)])
+        self.assertEqual(accepted, {('move', 0), ('move', 1)})
+        self.assertEqual(rejected, [])
+
+    def test_rejected_move_keeps_its_old_slot(self):
+        # A cannot move onto C, so A keeps slot 9 and neither B nor the create can take it
+        accepted, rejected = self.resolve(
+            {self.A: 9, self.B: 10, self.C: 11}, creates=[9], moves=[(self.A, 11), (self.B, 9)],
+        )
+        self.assertEqual(accepted, set())
+        self.assertEqual(sorted(rejected), [('create', 0), ('move', 0), ('move', 1)])
+
+    def test_cancelled_slot_can_be_reused(self):
+        accepted, rejected = self.resolve({self.A: 9, self.B: 10}, creates=[9], moves=[(self.B, 9)], cancels=[self.A])
+        self.assertEqual(accepted, {('create', 0)})
+        self.assertEqual(rejected, [('move', 0)])
+
+    def test_first_item_in_request_order_wins(self):
+        accepted, rejected = self.resolve({}, creates=[9, 9, 10])
+        self.assertEqual(accepted, {('create', 0), ('create', 2)})
+        self.assertEqual(rejected, [('create', 1)])
+
+    def test_rotation_moves_every_reservation(self):
+        existing = {pk: pk for pk in range(100)}
+        accepted, rejected = self.resolve(existing, moves=[(pk, (pk + 1) % 100) for pk in range(100)])
+        self.assertEqual(len(accepted), 100)
+        self.assertEqual(rejected, [])
+
+    def test_blocked_rotation_leaves_every_reservation_in_place(self):
+        existing = {pk: pk for pk in range(10)}
+        existing['blocker'] = 10
+        accepted, rejected = self.resolve(existing, moves=[(pk, pk + 1) for pk in range(10)])
+        self.assertEqual(accepted, set())
+        self.assertEqual(len(rejected), 10)
+
+
+class NationalCodeTests(SimpleTestCase):
+    def test_checksum(self):
+        for code in ['0499370899', '1234567891', '0000000061', '0000000140']:
+            self.assertTrue(is_valid_national_code(code), code)
+        for code in ['0499370898', '1234567890', '0000000060', '1111111111', '0000000000', '049937089', '04993708a9']:
+            self.assertFalse(is_valid_national_code(code), code)
+
+    def test_find_national_code_in_ocr_text(self):
+        self.assertEqual(find_national_code('کد ملی: ۰۴۹-۹۳۷۰۸۹-۹ تاریخ ۱۳۹۰/۰۱/۰۱'), '0499370899')
+        self.assertEqual(find_national_code('شماره 0499370898 و 1234567891'), '1234567891')
+        self.assertIsNone(find_national_code('1111111111 0499370898'))
+
+
+
+def card_image():
+    buffer = io.BytesIO()
+    Image.new('RGB', (4, 4), 'white').save(buffer, format='PNG')
+    return 'data:image/png;base64,' + base64.b64encode(buffer.getvalue()).decode()
+
+
+@mock.patch('user.views.pytesseract.image_to_string')
+class CheckInTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='desk'))
+        self.doctor = Doctor.objects.create(user=User.objects.create(username='doc'), name='Dr A')
+        self.patient = Patient.objects.create(
+            first_name='a', last_name='b', national_code='0499370899', date_of_birth='1990-01-01',
+            type_of_insurance='t', user=User.objects.create(username='patient'),
+        )
+
+    def check_in(self, image=None, doctor=None):
+        return self.client.post('/user/queue/check-in/', {
+            'image': image or card_image(), 'doctor': doctor or self.doctor.id,
+        }, format='json')
+
+    def test_patient_is_appended_to_the_queue(self, image_to_string):
+        image_to_string.return_value = 'کارت ملی\nشماره ملی: ۰۴۹-۹۳۷۰۸۹-۹\n'
+        for i in range(20):
+            other = Patient.objects.create(first_name='x', last_name='y', national_code=f'{i:010d}', date_of_birth='1990-01-01',
+                                           type_of_insurance='t', user=User.objects.create(username=f'p{i}'))
+            Queue.objects.create(doctor=self.doctor, patient=other, position=i + 1)
+        response = self.check_in()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {
+            'patient': self.patient.id, 'national_code': '0499370899', 'position': 21,
+            'voice_files': ['voice/PS1505-iww234963dgd-www/20o.mp3', 'voice/PS1505-iww234963dgd-www/1.mp3'],
+        })
+        self.assertEqual(image_to_string.call_args.kwargs, {'lang': 'fas'})
+        self.assertTrue(Queue.objects.filter(doctor=self.doctor, patient=self.patient, position=21).exists())
+
+    def test_patient_already_in_the_queue_keeps_its_position(self, image_to_string):
+        image_to_string.return_value = '0499370899'
+        Queue.objects.create(doctor=self.doctor, patient=self.patient, position=3)
+        response = self.check_in()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['position'], 3)
+        self.assertEqual(response.json()['voice_files'], ['voice/PS1505-iww234963dgd-www/3.mp3'])
+        self.assertEqual(Queue.objects.count(), 1)
+
+    def test_unknown_patient_or_doctor(self, image_to_string):
+        image_to_string.return_value = '1234567891'
+        response = self.check_in()
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {'error': 'Patient not found', 'national_code': '1234567891'})
+        image_to_string.return_value = '0499370899'
+        response = self.check_in(doctor=999)
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {'error': 'Doctor not found'})
+        self.assertFalse(Queue.objects.exists())
+
+    def test_bad_images_and_unreadable_codes_are_rejected(self, image_to_string):
+        image_to_string.return_value = '0499370899'
+        for image in ['no-comma', 'data:image/png;base64,!!!', 'data:image/png;base64,' + base64.b64encode(b'not an image').decode()]:
+            response = self.check_in(image=image)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {'error': 'Invalid image'})
+        image_to_string.return_value = 'شماره ملی: ۰۴۹۹۳۷۰۸۹۸'
+        response = self.check_in()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'No valid national code found on the card'})
+        self.assertEqual(self.check_in(doctor='abc').status_code, 400)
+        self.assertFalse(Queue.objects.exists())
+
+
+class FastJSONRendererTests(SimpleTestCase):
+    def assertSameAsDRF(self, data):
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_output_is_byte_identical_to_json_renderer(self):
+        self.assertSameAsDRF({
+            'text': 'سلام </script> \u2028 \u2029 \x00 😀',
+            'line\u2028key': None,
+            'numbers': [0, -1, 2 ** 63 - 1, 0.1, -0.0, 1.5, 1e16, 1e-07, 1.5e300, 123456789012345678.0],
+            'when': datetime.datetime(2024, 1, 1, 8, 0, 0, 123456, tzinfo=datetime.timezone.utc),
+            'naive': datetime.datetime(2024, 1, 1),
+            'date': datetime.date(2024, 1, 1),
+            'time': datetime.time(9, 30, 0, 5000),
+            'price': decimal.Decimal('10.50'),
+            'id': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+            'nested': [{'x': 1.0, 'y': True, 'z': (1, 2)}],
+            'mention': '"a:1e5,"',
+            1: 'int key',
+        })
+
+    def test_non_finite_floats_are_rejected_like_json_renderer(self):
+        for value in [float('nan'), float('inf'), [None, {'x': float('-inf')}]]:
+            with self.assertRaises(ValueError):
+                JSONRenderer().render({'v': value})
+            with self.assertRaises(ValueError):
+                FastJSONRenderer().render({'v': value})
+
+    def test_non_strict_mode_writes_non_finite_floats_like_json_renderer(self):
+        with mock.patch.object(JSONRenderer, 'strict', False):
+            self.assertSameAsDRF({'v': [float('nan'), float('inf'), None]})
+
+
+class FastJSONParserTests(SimpleTestCase):
+    def parse(self, parser, data):
+        return parser.parse(io.BytesIO(data), 'application/json', {'encoding': 'utf-8'})
+
+    def test_output_matches_json_parser(self):
+        for data in [
+            '{"name": "سلام", "n": [0, -1, 1.5, 1e3, 18446744073709551615], "x": null, "t": true}'.encode(),
+            b'{"id": 123456789012345678901234567890, "neg": -9223372036854775809, "f": 1.25}',
+            b'"12345678901234567890123"',
+        ]:
+            self.assertEqual(self.parse(FastJSONParser(), data), self.parse(JSONParser(), data))
+
+    def test_integers_beyond_64_bits_stay_exact(self):
+        result = self.parse(FastJSONParser(), b'{"id": 123456789012345678901234567890}')
+        self.assertEqual(result, {'id': 123456789012345678901234567890})
+        self.assertIsInstance(result['id'], int)
+
+    def test_invalid_json_raises_parse_error(self):
+        for data in [b'{"a": ', b'{"id": 12345678901234567890123']:
+            with self.assertRaises(ParseError):
+                self.parse(FastJSONParser(), data)
+
+
+class CompressionMiddlewareTests(SimpleTestCase):
+    body = b'{"name": "visit", "price": "10.00"}' * 100
+
+    def respond(self, accept_encoding='gzip, br', response=None):
+        if response is None:
+            response = HttpResponse(self.body, content_type='application/json')
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING=accept_encoding)
+        return CompressionMiddleware(lambda request: response)(request)
+
+    def content(self, response):
+        if response.streaming:
+            return b''.join(response.streaming_content)
+        return response.content
+
+    def decompress(self, response):
+        content = self.content(response)
+        if response.get('Content-Encoding') == 'br':
+            return brotli.decompress(content)
+        return gzip.decompress(content)
+
+    def test_gzip(self):
+        response = self.respond('gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(int(response['Content-Length']), len(response.content))
+        self.assertEqual(self.decompress(response), self.body)
+
+    @override_settings(COMPRESSION_MIN_SIZE=4096)
+    def test_size_threshold(self):
+        response = self.respond('gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.content, self.body)
+        with override_settings(COMPRESSION_MIN_SIZE=len(self.body)):
+            self.assertEqual(self.respond('gzip')['Content-Encoding'], 'gzip')
+
+    def test_refused_encodings_are_not_used(self):
+        for accept_encoding in ['', 'identity', 'gzip;q=0, br;q=0', 'gzip;q=0, br;q=0, identity', '*;q=0']:
+            response = self.respond(accept_encoding)
+            self.assertFalse(response.has_header('Content-Encoding'), accept_encoding)
+            self.assertEqual(response.content, self.body)
+            self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(self.respond('*')['Content-Encoding'], 'br' if brotli else 'gzip')
+        self.assertEqual(self.respond('br;q=0, *')['Content-Encoding'], 'gzip')
+
+    @skipUnless(brotli, 'brotli is not installed')
+    def test_brotli_is_preferred_unless_gzip_ranks_higher(self):
+        for accept_encoding, expected in [
+            ('gzip, deflate, br', 'br'),
+            ('gzip;q=1.0, br;q=0.5', 'gzip'),
+            ('br;q=0.1, gzip;q=0.2', 'gzip'),
+            ('gzip;q=0.5, br;q=0.5', 'br'),
+        ]:
+            response = self.respond(accept_encoding)
+            self.assertEqual(response['Content-Encoding'], expected, accept_encoding)
+            self.assertEqual(self.decompress(response), self.body)
+
+    @skipUnless(brotli, 'brotli is not installed')
+    def test_brotli_output_is_padded(self):
+        lengths = set()
+        for _ in range(10):
+            response = self.respond('br')
+            self.assertEqual(self.decompress(response), self.body)
+            lengths.add(len(response.content))
+        self.assertGreater(len(lengths), 1)
+        self.assertGreater(min(lengths), len(brotli.compress(self.body, quality=CompressionMiddleware.brotli_quality)))
+
+    def test_only_allowlisted_content_types_are_compressed(self):
+        for content_type, compressed in [
+            ('application/json', True),
+            ('text/csv; charset=utf-8', True),
+            ('application/x-ndjson', True),
+            ('image/png', False),
+            ('application/zip', False),
+            ('application/octet-stream', False),
+        ]:
+            response = self.respond('gzip', HttpResponse(self.body, content_type=content_type))
+            self.assertEqual(response.get('Content-Encoding'), 'gzip' if compressed else None, content_type)
+
+    def test_already_encoded_responses_are_left_alone(self):
+        response = HttpResponse(self.body, content_type='application/json', headers={'Content-Encoding': 'gzip'})
+        self.assertEqual(self.respond('gzip', response).content, self.body)
+
+    def test_etag_is_weakened(self):
+        response = HttpResponse(self.body, content_type='application/json', headers={'ETag': '"abc"'})
+        self.assertEqual(self.respond('gzip', response)['ETag'], 'W/"abc"')
+
+    def test_streaming_responses_are_compressed_regardless_of_size(self):
+        chunks = [b'id,name\n', b'1,a\n']
+        encodings = ['gzip', 'br'] if brotli else ['gzip']
+        for encoding in encodings:
+            response = self.respond(encoding, StreamingHttpResponse(iter(chunks), content_type='text/csv'))
+            self.assertEqual(response['Content-Encoding'], encoding)
+            self.assertFalse(response.has_header('Content-Length'))
+            self.assertEqual(self.decompress(response), b''.join(chunks))
+        response = self.respond('gzip', StreamingHttpResponse(iter(chunks), content_type='image/png'))
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(b''.join(response.streaming_content), b''.join(chunks))
+
+
+@override_settings(MEDIA_URL='/media/')
+class FastListSerializerTests(TestCase):
+    def setUp(self):
+        self.request = RequestFactory().get('/user/services/')
+        doctor = Doctor.objects.create(user=User.objects.create(username='doc'), name='Dr A')
+        Service.objects.create(doctor=doctor, service_code='S1', service_name='visit', service_price=10,
+                               insurance_price=5, service_image='services/visit.png')
+        Service.objects.create(doctor=doctor, service_code='S2', service_name='test', service_price=20,
+                               insurance_price=5)
+        for i in range(2):
+            patient = Patient.objects.create(first_name='a', last_name='b', national_code=f'{i:010d}',
+                                             date_of_birth='1990-01-01', type_of_insurance='t',
+                                             user=User.objects.create(username=f'p{i}'))
+            Queue.objects.create(doctor=doctor, patient=patient, position=i + 1)
+
+    def assertSameAsModelPath(self, serializer_class, queryset, context):
+        with self.assertNumQueries(1):
+            fast = serializer_class(queryset, many=True, context=context).data
+        self.assertEqual(fast, serializer_class(list(queryset), many=True, context=context).data)
+        self.assertEqual(JSONRenderer().render(fast),
+                         JSONRenderer().render(serializer_class(list(queryset), many=True, context=context).data))
+        return fast
+
+    def test_service_public_serializer(self):
+        data = self.assertSameAsModelPath(ServicePublicSerializer, Service.objects.order_by('service_code'),
+                                          {'request': self.request})
+        self.assertEqual(data[0]['service_image'], 'http://testserver/media/services/visit.png')
+        self.assertIsNone(data[1]['service_image'])
+        data = self.assertSameAsModelPath(ServicePublicSerializer, Service.objects.order_by('service_code'), {})
+        self.assertEqual(data[0]['service_image'], '/media/services/visit.png')
+
+    def test_queue_serializer(self):
+        data = self.assertSameAsModelPath(QueueSerializer, Queue.objects.order_by('position'), {})
+        self.assertEqual([entry['position'] for entry in data], [1, 2])
+        self.assertEqual(set(data[0]), {'id', 'patient', 'doctor', 'position', 'timestamp'})
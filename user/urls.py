@@ -6,7 +6,9 @@ from .views import (
     UserSpecialtyView, SpecialtyListView, CallPatientView, 
     DoctorRegistrationView, PatientRegistrationView, OCRAPIView, 
     ManualEntryAPIView, DoctorServiceListView, ServiceListCreateView, 
-    ServiceDetailView
+    ServiceDetailView, BulkImportView, ExportView,
+    ReservationHistoryView, PatientSearchView, CheckInView,
+    ReservationBatchView, QueueBatchView
 )
 
 urlpatterns = [
@@ -15,13 +17,18 @@ urlpatterns = [
     path('register/', RegisterView.as_view(), name='register'),
     path('login/', LoginView.as_view(), name='login'),
     path('queue/', QueueListCreateView.as_view(), name='queue_list_create'),
+    path('queue/bulk/', QueueBatchView.as_view(), name='queue_bulk'),
+    path('queue/check-in/', CheckInView.as_view(), name='queue_check_in'),
     path('queue/next/<int:doctor_id>/', NextPatientView.as_view(), name='next_patient'),
     path('doctor/<int:doctor_id>/call/<str:call_type>/', CallPatientView.as_view(), name='call_patient'),
     path('doctors/register/', DoctorRegistrationView.as_view(), name='doctor_register'),
     path('specialties/', SpecialtyListView.as_view(), name='specialties_list'),
     path('specialties/<int:specialty_id>/doctors/', DoctorListBySpecialtyView.as_view(), name='doctors_by_specialty'),
     path('reservations/', ReservationCreateView.as_view(), name='create_reservation'),
+    path('reservations/bulk/', ReservationBatchView.as_view(), name='reservation_bulk'),
+    path('reservations/history/', ReservationHistoryView.as_view(), name='reservation_history'),
     path('patient/register/', PatientRegistrationView.as_view(), name='patient_register'),
+    path('patients/search/', PatientSearchView.as_view(), name='patient_search'),
     path('api/ocr/', OCRAPIView.as_view(), name='api_ocr'),
     path('api/nationalidcards/', OCRAPIView.as_view(), name='nationalidcards'),
     path('api/available-times/<int:doctor_id>/', AvailableTimesView.as_view(), name='available-times'),
@@ -29,4 +36,6 @@ urlpatterns = [
     path('doctor/services/', ServiceListCreateView.as_view(), name='service_list_create'),
     path('doctor/services/<int:pk>/', ServiceDetailView.as_view(), name='service_detail'),
     path('doctor/<int:doctor_id>/services/', DoctorServiceListView.as_view(), name='doctor_services'),
+    path('api/import/<str:kind>/', BulkImportView.as_view(), name='bulk_import'),
+    path('api/export/<str:kind>/<str:fmt>/', ExportView.as_view(), name='export'),
 ]
@@ -0,0 +1,55 @@
+import re
+
+# Persian (۰-۹) and Arabic-Indic (٠-٩) digits to ASCII
+DIGITS = str.maketrans('۰۱۲۳۴۵۶۷۸۹'
+                       '٠١٢٣٤٥٦٧٨٩',
+                       '01234567890123456789')
+
+# Arabic letter forms that Persian keyboards and OCR produce interchangeably
+LETTERS = str.maketrans({
+    'ي': 'ی',
+    'ى': 'ی',
+    'ك': 'ک',
+    'ة': 'ه',
+    'ۀ': 'ه',
+    '\u0640': None,  # tatweel
+    '\u200c': ' ',  # zero-width non-joiner
+})
+
+DIACRITICS = re.compile('[\u064b-\u065f\u0670]')
+WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_digits(value):
+    return value.translate(DIGITS)
+
+
+def normalize_text(value):
+    value = DIACRITICS.sub('', value.translate(DIGITS).translate(LETTERS))
+    return WHITESPACE.sub(' ', value).strip().lower()
+
+
+def prefix_range(field, prefix):
+    # A range instead of startswith so the lookup can use a plain B-tree index on any backend
+    return {f'{field}__gte': prefix, f'{field}__lt': prefix + '\U0010ffff'}
+
+
+NATIONAL_CODE = re.compile(r'\d{3}\D?\d{6}\D?\d')
+
+
+def is_valid_national_code(code):
+    # Iranian national ID: 10 digits, the last one a mod-11 check digit over the first nine
+    if len(code) != 10 or not code.isdigit() or len(set(code)) == 1:
+        return False
+    remainder = sum(int(digit) * (10 - i) for i, digit in enumerate(code[:9])) % 11
+    check = int(code[9])
+    return check == remainder if remainder < 2 else check == 11 - remainder
+
+
+def find_national_code(text):
+    """Return the first checksum-valid national code in OCR text, or None."""
+    for match in NATIONAL_CODE.finditer(normalize_digits(text)):
+        code = re.sub(r'\D', '', match.group())
+        if is_valid_national_code(code):
+            return code
+    return None
@@ -1,29 +1,40 @@
 from rest_framework import generics, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
+from rest_framework.parsers import MultiPartParser
 from rest_framework.authentication import TokenAuthentication
 from rest_framework.authtoken.models import Token
 from django.contrib.auth import authenticate
 from django.shortcuts import get_object_or_404
 from django.core.files.storage import default_storage
 from django.forms.models import model_to_dict
+from django.db import transaction
+from django.db.models import Exists, Max, OuterRef
 from django.views import View
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
+from django.conf import settings
 from io import BytesIO
-from PIL import Image
+from PIL import Image, UnidentifiedImageError
 import base64
 import os
 import pytesseract
 import re
 import datetime
 
-from .models import Patient, Doctor, Queue, NationalIDCard, Specialty, Service, Reservation
+from .models import Patient, PatientNameToken, Doctor, Queue, QueueHistory, NationalIDCard, Specialty, Service, Reservation
 from .serializers import (
     UserSerializer, PatientSerializer, DoctorSerializer, QueueSerializer, 
     ReservationSerializer, SpecialtySerializer, NationalIDCardSerializer, 
-    ServiceSerializer, ServicePublicSerializer, ImageUploadSerializer
+    ServiceSerializer, ServicePublicSerializer, ImageUploadSerializer,
+    PatientSearchSerializer
 )
+from .importers import FORMATS, IMPORTERS
+from .exporters import EXPORTS, FORMATS as EXPORT_FORMATS, stream_export
+from .archive import reservation_history, remove_queue_entries
+from .utils import normalize_text, prefix_range, find_national_code
+from .bulk import BatchError, ReservationBatch, QueueBatch
+from .permissions import IsAdminOrDoctor
 
 
 class AvailableTimesView(APIView):
@@ -54,19 +65,23 @@ class AvailableTimesView(APIView):
 
 
 
+def read_card_text(data):
+    # Decode the base64 image
+    image_data = base64.b64decode(data.split(",")[1])
+    image_file = BytesIO(image_data)
+    image = Image.open(image_file)
+
+    # Use pytesseract to extract text
+    return pytesseract.image_to_string(image, lang='fas')
+
+
 class OCRAPIView(APIView):
     def post(self, request, *args, **kwargs):
         data = request.data.get('image')
         if not data:
             return Response({"error": "No image provided"}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Decode the base64 image
-        image_data = base64.b64decode(data.split(",")[1])
-        image_file = BytesIO(image_data)
-        image = Image.open(image_file)
-        
-        # Use pytesseract to extract text
-        text = pytesseract.image_to_string(image, lang='fas')
+        text = read_card_text(data)
 
         # Clean and split the text by lines
         lines = re.split(r'\n+', text.strip())
@@ -106,9 +121,12 @@ class CallPatientView(APIView):
         if call_type == 'initial':
             patient_queue = queue.first()
         elif call_type == 'next':
-            patient_queue = queue.first()
-            if patient_queue:
-                patient_queue.delete()
+            with transaction.atomic():
+                # Same doctor lock as check-in and queue batches, so the entry archived is current
+                list(Doctor.objects.select_for_update().filter(pk=doctor.pk).values_list('pk', flat=True))
+                patient_queue = queue.first()
+                if patient_queue:
+                    remove_queue_entries([patient_queue], QueueHistory.CALLED)
         elif call_type == 'last':
             patient_queue = queue.last()
         else:
@@ -168,10 +186,13 @@ class NextPatientView(APIView):
 
     def get(self, request, doctor_id, *args, **kwargs):
         try:
-            doctor = Doctor.objects.get(pk=doctor_id)
-            next_patient = Queue.objects.filter(doctor=doctor).order_by('position').first()
+            with transaction.atomic():
+                # Same doctor lock as check-in and queue batches, so the entry archived is current
+                doctor = Doctor.objects.select_for_update().get(pk=doctor_id)
+                next_patient = Queue.objects.filter(doctor=doctor).order_by('position').first()
+                if next_patient:
+                    remove_queue_entries([next_patient], QueueHistory.CALLED)
             if next_patient:
-                next_patient.delete()
                 return Response({'message': f'Next patient: {next_patient.patient.user.username}'}, status=status.HTTP_200_OK)
             return Response({'message': 'No patients in queue'}, status=status.HTTP_200_OK)
         except Doctor.DoesNotExist:
@@ -212,7 +233,7 @@ class DoctorListBySpecialtyView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, specialty_id):
-        doctors = Doctor.objects.filter(specialty=specialty_id)
+        doctors = Doctor.objects.filter(specialty=specialty_id).select_related('user')
         serializer = DoctorSerializer(doctors, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -275,3 +296,214 @@ class DoctorServiceListView(generics.ListAPIView):
     def get_queryset(self):
         doctor_id = self.kwargs.get('doctor_id')
         return Service.objects.filter(doctor__id=doctor_id)
+
+
+class BulkImportView(APIView):
+    permission_classes = [IsAdminUser]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request, kind):
+        importer_class = IMPORTERS.get(kind)
+        if importer_class is None:
+            return Response({'error': 'Unknown import type'}, status=status.HTTP_404_NOT_FOUND)
+
+        upload = request.FILES.get('file')
+        if not upload:
+            return Response({'error': 'No file provided'}, status=status.HTTP_400_BAD_REQUEST)
+
+        fmt = request.data.get('format') or os.path.splitext(upload.name)[1].lstrip('.').lower()
+        if fmt not in FORMATS:
+            return Response({'error': 'Invalid format'}, status=status.HTTP_400_BAD_REQUEST)
+
+        max_reported = getattr(settings, 'BULK_IMPORT_MAX_REPORTED_ERRORS', 1000)
+        rejected_rows = []
+
+        def on_reject(line_number, errors):
+            if len(rejected_rows) < max_reported:
+                rejected_rows.append({'line': line_number, 'errors': errors})
+
+        # Iterating an UploadedFile yields byte lines chunk by chunk, so the file is never read whole
+        result = importer_class(on_reject=on_reject).run(upload, fmt)
+
+        return Response({**result.as_dict(), 'rejected_rows': rejected_rows}, status=status.HTTP_200_OK)
+
+
+EXPORT_CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+}
+
+class ExportView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, kind, fmt):
+        if kind not in EXPORTS:
+            return Response({'error': 'Unknown export type'}, status=status.HTTP_404_NOT_FOUND)
+        if fmt not in EXPORT_FORMATS:
+            return Response({'error': 'Invalid format'}, status=status.HTTP_400_BAD_REQUEST)
+
+        filters = {}
+        for name in ('date_from', 'date_to'):
+            value = request.GET.get(name)
+            if value:
+                try:
+                    filters[name] = datetime.datetime.strptime(value, '%Y-%m-%d').date()
+                except ValueError:
+                    return Response({'error': 'Invalid date format'}, status=status.HTTP_400_BAD_REQUEST)
+        doctor = request.GET.get('doctor')
+        if doctor:
+            if not doctor.isdigit():
+                return Response({'error': 'Invalid doctor'}, status=status.HTTP_400_BAD_REQUEST)
+            filters['doctor'] = int(doctor)
+
+        response = StreamingHttpResponse(stream_export(kind, fmt, **filters), content_type=EXPORT_CONTENT_TYPES[fmt])
+        response['Content-Disposition'] = f'attachment; filename="{kind}.{fmt}"'
+        return response
+
+
+class ReservationHistoryView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        filters = {}
+        for name in ('date_from', 'date_to'):
+            value = request.GET.get(name)
+            if value:
+                try:
+                    filters[name] = datetime.datetime.strptime(value, '%Y-%m-%d').date()
+                except ValueError:
+                    return Response({'error': 'Invalid date format'}, status=status.HTTP_400_BAD_REQUEST)
+        for name in ('doctor', 'patient'):
+            value = request.GET.get(name)
+            if value:
+                if not value.isdigit():
+                    return Response({'error': f'Invalid {name}'}, status=status.HTTP_400_BAD_REQUEST)
+                filters[name] = int(value)
+
+        limit = request.GET.get('limit', '100')
+        if not limit.isdigit():
+            return Response({'error': 'Invalid limit'}, status=status.HTTP_400_BAD_REQUEST)
+        limit = min(int(limit), 1000)
+
+        reservations = reservation_history(**filters).order_by('-date', '-time')[:limit]
+        return Response({'reservations': list(reservations)}, status=status.HTTP_200_OK)
+
+
+def search_patients_by_name(query, limit):
+    # Every typed word must prefix some word of "first last". Each word's token range is
+    # counted up to the scan limit and the rarest word is walked in index order, with an
+    # EXISTS probe per row for the other words. A word that matches nothing ends the search
+    # at once, and no search walks more than `scan_limit` tokens; when every word is that
+    # common, the first matches found are returned.
+    scan_limit = getattr(settings, 'PATIENT_SEARCH_SCAN_LIMIT', 5000)
+    words = list(dict.fromkeys(query.split()))
+    counts = {}
+    for word in words:
+        counts[word] = PatientNameToken.objects.filter(**prefix_range('token', word))[:scan_limit].count()
+        if not counts[word]:
+            return []
+    # Ties (usually several words at the cap) go to the longest word, whatever order they were typed in
+    anchor = min(words, key=lambda word: (counts[word], -len(word), word))
+    probes = {
+        f'has_{i}': Exists(PatientNameToken.objects.filter(patient_id=OuterRef('patient_id'), **prefix_range('token', word)))
+        for i, word in enumerate(word for word in words if word != anchor)
+    }
+    candidates = (
+        PatientNameToken.objects.filter(**prefix_range('token', anchor)).annotate(**probes)
+        .order_by('token', 'patient_id').values_list('patient_id', *probes)[:scan_limit]
+    )
+
+    matches = []
+    for patient_id, *found in candidates.iterator(chunk_size=limit * 4):
+        if all(found) and patient_id not in matches:
+            matches.append(patient_id)
+            if len(matches) == limit:
+                break
+    patients = Patient.objects.in_bulk(matches)
+    return [patients[patient_id] for patient_id in matches]
+
+
+class PatientSearchView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        query = normalize_text(request.GET.get('q', ''))
+        if not query:
+            return Response({'error': 'No search query provided'}, status=status.HTTP_400_BAD_REQUEST)
+
+        limit = request.GET.get('limit', '20')
+        if not limit.isdigit() or int(limit) < 1:
+            return Response({'error': 'Invalid limit'}, status=status.HTTP_400_BAD_REQUEST)
+        limit = min(int(limit), 100)
+
+        if query.isdigit():
+            patients = Patient.objects.filter(**prefix_range('national_code', query)).order_by('national_code')
+        else:
+            patients = search_patients_by_name(query, limit)
+
+        serializer = PatientSearchSerializer(patients[:limit], many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class CheckInView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        data = request.data.get('image')
+        if not data:
+            return Response({"error": "No image provided"}, status=status.HTTP_400_BAD_REQUEST)
+        doctor_id = str(request.data.get('doctor', ''))
+        if not doctor_id.isdigit():
+            return Response({'error': 'Invalid doctor'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            text = read_card_text(data)
+        except (ValueError, IndexError, UnidentifiedImageError):
+            return Response({"error": "Invalid image"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Misreads fail the checksum, so they are rejected before any query runs
+        national_code = find_national_code(text)
+        if not national_code:
+            return Response({'error': 'No valid national code found on the card'}, status=status.HTTP_400_BAD_REQUEST)
+
+        patient = Patient.objects.filter(national_code=national_code).first()
+        if not patient:
+            return Response({'error': 'Patient not found', 'national_code': national_code}, status=status.HTTP_404_NOT_FOUND)
+
+        with transaction.atomic():
+            # Locking the doctor row serializes concurrent check-ins so positions stay unique
+            doctor = Doctor.objects.select_for_update().filter(pk=doctor_id).first()
+            if not doctor:
+                return Response({'error': 'Doctor not found'}, status=status.HTTP_404_NOT_FOUND)
+            entry = Queue.objects.filter(doctor=doctor, patient=patient).first()
+            created = entry is None
+            if created:
+                last_position = Queue.objects.filter(doctor=doctor).aggregate(last=Max('position'))['last'] or 0
+                entry = Queue.objects.create(doctor=doctor, patient=patient, position=last_position + 1)
+
+        return Response({
+            'patient': patient.id,
+            'national_code': national_code,
+            'position': entry.position,
+            'voice_files': get_voice_files(entry.position),
+        }, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+
+class BatchView(APIView):
+    permission_classes = [IsAdminOrDoctor]
+    batch_class = None
+
+    def post(self, request):
+        # Admins may touch any row; a doctor only rows under their own schedule
+        doctor = None if request.user.is_staff else request.user.doctor
+        try:
+            results = self.batch_class(request.data, doctor=doctor).run()
+        except BatchError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(results, status=status.HTTP_200_OK)
+
+class ReservationBatchView(BatchView):
+    batch_class = ReservationBatch
+
+class QueueBatchView(BatchView):
+    batch_class = QueueBatch